@@ -1,144 +1,362 @@
 import aiohttp
+import asyncio
 import json
-import re
+import logging
+import random
+from contextlib import asynccontextmanager, contextmanager
 
-from config import YANDEX_ID_KEY, YANDEX_API_KEY
+import metrics
+import settings
+from response_cache import get_default_cache
+from config import YANDEX_ID_KEY, YANDEX_API_KEY, YANDEX_COMPLETION_URL
 from StoryObject import StoryObject
+from storygen.convert import convert_ai_array_to_graph_format
+from storygen.parsing import SceneStreamParser, clean_json_response, parse_scene_array, parse_scenes_with_fragments
+from storygen.prompt import (build_act_outline_prompt, build_acts_prompt, build_expand_prompt, build_outline_prompt,
+                             build_prompt, build_regenerate_prompt, build_repair_prompt)
+from storygen.regenerate import RegenerationContext
 
-def clean_json_response(text: str) -> str:
-    text = re.sub(r'^```(?:json)?\s*', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\s*```$', '', text, flags=re.MULTILINE)
-    text = text.strip()
-    
-    start = text.find('[')
-    end = text.rfind(']')
-    
-    if start == -1 or end == -1 or end <= start:
-        raise json.JSONDecodeError("Не удалось найти валидный JSON-массив в ответе.", text, 0)
-        
-    content = text[start+1:end].strip()
-    
-    fixed_content = re.sub(r'\}\s*\{', '}, {', content, flags=re.DOTALL)
-    
-    return f"[{fixed_content}]"
-
-def convert_ai_array_to_graph_format(scene_list: list[dict], story_object: StoryObject) -> dict:
-    if not scene_list:
-        raise ValueError("AI вернул пустой список сцен.")
-        
-    scene_id_to_id = {}
-    formatted_scenes = []
-    
-    for i, scene_data in enumerate(scene_list):
-        original_scene_id = scene_data.get('scene_id', str(i+1))
-        new_id = str(i+1)
-        scene_id_to_id[original_scene_id] = new_id
-        
-        formatted_scenes.append({
-            'scene_id': new_id,
-            'text': scene_data.get('text', scene_data.get('description', 'Описание отсутствует.')),
-            'choices': [{
-                'text': c.get('text', '...'),
-                'next_scene': c.get('next_scene', c.get('next_scene', ''))
-            } for c in scene_data.get('choices', [])],
-            'is_ending': not scene_data.get('choices', not scene_data.get('is_ending', False))
-        })
-    
-    for scene in formatted_scenes:
-        for choice in scene['choices']:
-            original_next_scene_id = choice['next_scene']
-            if original_next_scene_id in scene_id_to_id:
-                choice['next_scene'] = scene_id_to_id[original_next_scene_id]
-    
-    start_scene_id = scene_id_to_id.get("1", "1")
-    
-    title_text = story_object.description[:50]
-    if len(story_object.description) > 50:
-        title_text += "..."
-        
-    return {
-        'title': title_text,
-        'description': story_object.description,
-        'start_scene': start_scene_id,
-        'scenes': formatted_scenes
-    }
+logger = logging.getLogger(__name__)
+
+COMPLETION_URL = YANDEX_COMPLETION_URL
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+def _parse_completion(raw_response: str) -> tuple[str, dict]:
+    try:
+        result = json.loads(raw_response)["result"]
+        return result["alternatives"][0]["message"]["text"], result.get("usage") or {}
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError):
+        return raw_response, {}
+
+async def _iter_lines(content):
+    # readline у aiohttp ограничен размером буфера чтения, а строка потока несёт весь накопленный текст
+    pending = []
+    async for chunk in content.iter_any():
+        start = 0
+        end = chunk.find(b"\n")
+        while end != -1:
+            pending.append(chunk[start:end])
+            yield b"".join(pending)
+            pending = []
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        pending.append(chunk[start:])
+    tail = b"".join(pending)
+    if tail:
+        yield tail
 
-async def get_story_from_ai(story_object: StoryObject) -> dict:
+async def _read_streamed_completion(response, on_scene, current_span=None) -> tuple[str, dict]:
+    parser = SceneStreamParser()
+    generated_text = ""
+    usage = {}
+    async for raw_line in _iter_lines(response.content):
+        line = raw_line.decode('utf-8').strip()
+        if not line:
+            continue
+        try:
+            result = json.loads(line)["result"]
+            text = result["alternatives"][0]["message"]["text"]
+        except (json.JSONDecodeError, KeyError, IndexError, TypeError):
+            continue
+        if current_span is not None:
+            current_span.mark('first_chunk')
+        # usage приходит в каждом фрагменте, итоговые значения - в последнем
+        usage = result.get("usage") or usage
+
+        # YandexGPT присылает накопленный текст целиком, а не только дельту
+        if text.startswith(generated_text):
+            delta = text[len(generated_text):]
+            generated_text = text
+        else:
+            delta = text
+            generated_text += text
+
+        for scene in parser.feed(delta):
+            on_scene(scene)
+    return generated_text, usage
+
+def _record_usage(current_span, usage: dict):
+    for field, name in (("inputTextTokens", "input_tokens"), ("completionTokens", "completion_tokens")):
+        try:
+            tokens = int(usage[field])
+        except (KeyError, TypeError, ValueError):
+            continue
+        current_span[name] = tokens
+        metrics.count(f"ai.{name}", tokens)
+
+def _check_keys():
     if not YANDEX_API_KEY or not YANDEX_ID_KEY:
         raise ValueError("YANDEX_API_KEY и YANDEX_ID_KEY должны быть установлены в .env файле.")
 
-    prompt = {
-        "modelUri": f"gpt://{YANDEX_ID_KEY}/yandexgpt-lite",
-        "completionOptions": {
-            "stream": False,
-            "temperature": 0.75,
-            "maxTokens": "16000"
-        },
-        "messages": [
-            {
-                "role": "system",
-                "text": """Ты — профессиональный сценарист для RPG.
-                Твоя задача — сгенерировать ЕДИНЫЙ JSON-МАССИВ, где каждый элемент — это одна сцена квеста.
-                
-                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
-                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
-                2.  **СТРУКТУРА ОБЪЕКТА**: Каждый объект в массиве должен иметь СТРОГУЮ структуру:
-                    {
-                      "scene_id": "1",  
-                      "text": "Полное, насыщенное описание сцены (80-150 слов).",
-                      "choices": [
-                        {"text": "Краткое описание выбора (2-5 слов)", "next_scene": "2"}
-                      ]
-                    }
-                3.  **ЗАПЯТЫЕ**: Между КАЖДЫМ объектом в массиве (например, между `}` и `{`) ДОЛЖНА стоять запятая.
-                4.  **ID СЦЕН**: scene_id должны быть последовательными числами от 1 до N в виде строк ("1", "2", "3" и т.д.)
-                5.  **КОНЦОВКИ**: Создай минимум две концовки (сцены без choices)
-                6.  **ВЕТВЛЕНИЕ**: Создай ветвление сюжета с уникальными путями
-                
-                ТРЕБОВАНИЯ К КОНТЕНТУ:
-                -   **Жанр**: Строго Ролевая игра (RPG).
-                -   **Язык**: Русский.
-                -   **Количество сцен**: От 6 до 12.
-                """
-            },
-            {
-                "role": "user",
-                "text": f"""Создай RPG квест по параметрам:
-                - **Описание**: {story_object.description}
-                - **Жанр**: {story_object.genre}
-                - **Персонажи**: {', '.join(story_object.heroes)}
-                - **Настроение**: {story_object.mood}
-                """
-            }
-        ]
-    }
+@asynccontextmanager
+async def _session_scope(session):
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=settings.AI_TOTAL_TIMEOUT)) as owned_session:
+        yield owned_session
 
-    url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+@contextmanager
+def _translate_errors():
+    try:
+        yield
+    except aiohttp.ClientError as e:
+        raise ConnectionError(f"Ошибка сети при обращении к AI: {e}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"AI вернул некорректный JSON, который не удалось исправить. Ошибка: {e}")
+    except Exception as e:
+        raise RuntimeError(f"Неожиданная ошибка при работе с AI: {e}")
+
+async def _complete(session, prompt: dict, on_scene=None) -> str:
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Api-Key {YANDEX_API_KEY}"
     }
+    stream = prompt["completionOptions"]["stream"]
+    with metrics.span('ai.request', stream=stream) as current:
+        async with session.post(COMPLETION_URL, headers=headers, json=prompt) as response:
+            current.mark('ttfb')
+            current['status'] = response.status
+            response.raise_for_status()
+            if stream:
+                generated_text, usage = await _read_streamed_completion(response, on_scene, current)
+            else:
+                generated_text, usage = _parse_completion(await response.text())
+        _record_usage(current, usage)
+        current['chars'] = len(generated_text)
+        return generated_text
 
+def _retry_after_seconds(error: aiohttp.ClientResponseError):
+    value = error.headers.get('Retry-After') if error.headers else None
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=prompt, timeout=120) as response:
-                response.raise_for_status()
-                raw_response = await response.text()
-                
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def _retry_delay(attempt: int, retry_after=None) -> float:
+    if retry_after is not None:
+        return min(retry_after, settings.AI_RETRY_MAX_DELAY)
+    # экспоненциальная задержка с полным джиттером
+    return random.uniform(0, min(settings.AI_RETRY_MAX_DELAY, settings.AI_RETRY_BASE_DELAY * 2 ** attempt))
+
+async def _complete_with_retries(session, prompt: dict, on_scene=None) -> str:
+    emitted = seen = 0
+
+    def on_scene_once(scene):
+        nonlocal emitted, seen
+        seen += 1
+        # при повторной попытке уже показанные сцены не дублируются
+        if seen > emitted:
+            emitted = seen
+            on_scene(scene)
+
+    for attempt in range(settings.AI_RETRY_ATTEMPTS):
+        last_attempt = attempt == settings.AI_RETRY_ATTEMPTS - 1
+        seen = 0
+        try:
+            return await _complete(session, prompt, on_scene_once if on_scene else None)
+        except aiohttp.ClientResponseError as e:
+            if e.status not in RETRYABLE_STATUSES or last_attempt:
+                raise
+            delay = _retry_delay(attempt, _retry_after_seconds(e))
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            if last_attempt:
+                raise
+            delay = _retry_delay(attempt)
+        logger.warning("Запрос к AI не удался (попытка %d из %d), повтор через %.1f с",
+                       attempt + 1, settings.AI_RETRY_ATTEMPTS, delay)
+        metrics.count('ai.retries', attempt=attempt + 1)
+        await asyncio.sleep(delay)
+
+async def _parse_scenes(session, generated_text: str) -> list[dict]:
+    with metrics.span('ai.parse', chars=len(generated_text)) as current:
+        try:
+            scene_list, repairs, broken_fragments = parse_scenes_with_fragments(generated_text)
+        except json.JSONDecodeError:
+            if not settings.AI_REPAIR_REQUESTS:
+                raise
+            scene_list, repairs, broken_fragments = [], [], [generated_text]
+        current['scenes'] = len(scene_list)
+        current['repairs'] = len(repairs)
+        current['broken_fragments'] = len(broken_fragments)
+    if repairs:
+        logger.warning("Ответ AI исправлен: %s", "; ".join(repairs))
+
+    if settings.AI_REPAIR_REQUESTS:
+        # отправляем на исправление только сломанный фрагмент, а не генерируем историю заново
+        for fragment in broken_fragments:
+            if len(fragment) > settings.AI_REPAIR_MAX_CHARS:
+                continue
+            with metrics.span('ai.repair', chars=len(fragment)) as current:
                 try:
-                    result_data = json.loads(raw_response)
-                    generated_text = result_data["result"]["alternatives"][0]["message"]["text"]
-                except (json.JSONDecodeError, KeyError):
-                    generated_text = raw_response
+                    repaired_text = await _complete_with_retries(session, build_repair_prompt(YANDEX_ID_KEY, fragment))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # без исправления остаются сцены, которые уже разобраны
+                    if not scene_list:
+                        raise
+                    logger.warning("Запрос на исправление JSON не удался: %s", e)
+                    current['error'] = type(e).__name__
+                    continue
+                try:
+                    repaired_scenes, _ = parse_scene_array(repaired_text)
+                except json.JSONDecodeError:
+                    current['scenes'] = 0
+                    continue
+                current['scenes'] = len(repaired_scenes)
+            logger.warning("Восстановлено сцен запросом на исправление: %d", len(repaired_scenes))
+            scene_list.extend(repaired_scenes)
 
-                cleaned_json_text = clean_json_response(generated_text)
-                scene_list = json.loads(cleaned_json_text)
-                
-                return convert_ai_array_to_graph_format(scene_list, story_object)
+    if not scene_list:
+        raise json.JSONDecodeError("Не удалось найти валидный JSON-массив в ответе.", generated_text, 0)
+    return scene_list
 
-    except aiohttp.ClientError as e:
-        raise ConnectionError(f"Ошибка сети при обращении к AI: {e}")
-    except json.JSONDecodeError as e:
-        raise ValueError(f"AI вернул некорректный JSON, который не удалось исправить. Ошибка: {e}")
-    except Exception as e:
-        raise RuntimeError(f"Неожиданная ошибка при работе с AI: {e}")
\ No newline at end of file
+async def _complete_scenes(session, prompt: dict, cache) -> list[dict]:
+    cache_key = cache.key_for(prompt) if cache else None
+    entry = cache.get(cache_key) if cache else None
+    if entry and entry.get('raw'):
+        metrics.count('ai.cache_hits')
+        return await _parse_scenes(session, entry['raw'])
+    if cache:
+        metrics.count('ai.cache_misses')
+
+    generated_text = await _complete_with_retries(session, prompt)
+    scene_list = await _parse_scenes(session, generated_text)
+    if cache:
+        cache.put(cache_key, generated_text, None)
+    return scene_list
+
+async def get_story_from_ai(story_object: StoryObject, on_scene=None, session=None,
+                            use_cache: bool = settings.AI_CACHE_ENABLED) -> dict:
+    _check_keys()
+
+    stream = on_scene is not None
+    prompt = build_prompt(story_object, YANDEX_ID_KEY, stream=stream)
+
+    cache = get_default_cache() if use_cache else None
+    cache_key = cache.key_for(prompt) if cache else None
+    if cache:
+        entry = cache.get(cache_key)
+        if entry and entry.get('story'):
+            metrics.count('ai.cache_hits')
+            return entry['story']
+        metrics.count('ai.cache_misses')
+
+    with _translate_errors(), metrics.span('ai.generate', stream=stream) as current:
+        async with _session_scope(session) as session:
+            generated_text = await _complete_with_retries(session, prompt, on_scene)
+            scene_list = await _parse_scenes(session, generated_text)
+        with metrics.span('story.convert', scenes=len(scene_list)):
+            story_data = convert_ai_array_to_graph_format(scene_list, story_object)
+        current['scenes'] = len(story_data['scenes'])
+
+    if cache:
+        cache.put(cache_key, generated_text, story_data)
+    return story_data
+
+async def _complete_outline(session, story_object: StoryObject, scene_count: int, cache, semaphore) -> list[dict]:
+    act_size = max(1, settings.OUTLINE_ACT_SCENES)
+    if scene_count <= act_size:
+        return await _complete_scenes(session, build_outline_prompt(story_object, YANDEX_ID_KEY, scene_count), cache)
+
+    # сначала краткие акты, затем план сцен каждого акта отдельным запросом
+    bounds = [(first, min(first + act_size - 1, scene_count)) for first in range(1, scene_count + 1, act_size)]
+    acts = await _complete_scenes(
+        session, build_acts_prompt(story_object, YANDEX_ID_KEY, [(str(a), str(b)) for a, b in bounds]), cache)
+    summaries = [act.get('text', '') for act in acts[:len(bounds)]]
+    summaries += [''] * (len(bounds) - len(summaries))
+
+    async def act_outline(act, first_id, last_id):
+        async with semaphore:
+            prompt = build_act_outline_prompt(story_object, YANDEX_ID_KEY, summaries, act, first_id, last_id)
+            return await _complete_scenes(session, prompt, cache)
+
+    parts = await asyncio.gather(*(act_outline(act, first, last) for act, (first, last) in enumerate(bounds)))
+
+    outline, seen = [], set()
+    for (first_id, last_id), part in zip(bounds, parts):
+        for scene in part:
+            scene_id = str(scene.get('scene_id', ''))
+            if scene_id.isdigit() and first_id <= int(scene_id) <= last_id and scene_id not in seen:
+                seen.add(scene_id)
+                outline.append(scene)
+    return outline
+
+def _batch_neighbours(outline: list[dict], batch_ids: list[str]) -> list[dict]:
+    batch = set(batch_ids)
+    linked = set()
+    for scene in outline:
+        scene_id = str(scene.get('scene_id'))
+        targets = {str(c.get('next_scene')) for c in scene.get('choices', [])}
+        if scene_id in batch:
+            linked |= targets
+        elif targets & batch:
+            linked.add(scene_id)
+    return [scene for scene in outline if str(scene.get('scene_id')) in linked - batch]
+
+async def get_large_story_from_ai(story_object: StoryObject, scene_count: int, session=None,
+                                  batch_size: int = settings.CHUNK_BATCH_SIZE,
+                                  concurrency: int = settings.CHUNK_CONCURRENCY,
+                                  use_cache: bool = settings.AI_CACHE_ENABLED) -> dict:
+    _check_keys()
+    cache = get_default_cache() if use_cache else None
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    with _translate_errors(), metrics.span('ai.generate_large', scene_count=scene_count) as current:
+        async with _session_scope(session) as session:
+            outline = await _complete_outline(session, story_object, scene_count, cache, semaphore)
+            scene_ids = [str(scene.get('scene_id', i + 1)) for i, scene in enumerate(outline)]
+            by_id = dict(zip(scene_ids, outline))
+
+            async def expand(batch_ids):
+                async with semaphore:
+                    scenes = [by_id[scene_id] for scene_id in batch_ids]
+                    neighbours = _batch_neighbours(outline, batch_ids)
+                    prompt = build_expand_prompt(story_object, YANDEX_ID_KEY, scenes, neighbours)
+                    return await _complete_scenes(session, prompt, cache)
+
+            batches = [scene_ids[i:i + batch_size] for i in range(0, len(scene_ids), batch_size)]
+            results = await asyncio.gather(*(expand(batch) for batch in batches), return_exceptions=True)
+
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures and len(failures) == len(results):
+            raise failures[0]
+
+        texts = {}
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Не удалось развернуть часть сцен: %s", result)
+                continue
+            for scene in result:
+                if scene.get('text'):
+                    texts[str(scene.get('scene_id'))] = scene['text']
+
+        merged = [{
+            'scene_id': scene_id,
+            'text': texts.get(scene_id) or scene.get('summary', 'Описание отсутствует.'),
+            'choices': [{
+                'text': c.get('text', '...'),
+                'next_scene': str(c.get('next_scene', ''))
+            } for c in scene.get('choices', [])]
+        } for scene_id, scene in zip(scene_ids, outline)]
+
+        missing = [scene_id for scene_id in scene_ids if scene_id not in texts]
+        if missing:
+            logger.warning("Для сцен %s использовано краткое содержание из плана", ", ".join(missing))
+
+        current['missing_texts'] = len(missing)
+        with metrics.span('story.convert', scenes=len(merged)):
+            return convert_ai_array_to_graph_format(merged, story_object)
+
+async def regenerate_scenes_from_ai(story_object: StoryObject, context: RegenerationContext, session=None) -> list[dict]:
+    _check_keys()
+    prompt = build_regenerate_prompt(story_object, YANDEX_ID_KEY, context.path, context.scenes, context.targets)
+
+    # без кэша: повторная перегенерация должна давать новый вариант
+    with _translate_errors(), metrics.span('ai.regenerate', scenes=len(context.scene_ids)) as current:
+        async with _session_scope(session) as session:
+            scene_list = await _complete_scenes(session, prompt, None)
+        scenes = context.merge(scene_list)
+        current['replaced'] = len(scenes)
+    if not scenes:
+        raise ValueError("AI не вернул ни одной из запрошенных сцен.")
+    return scenes
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import aiohttp
+
+import settings
+
+
+class AIClient:
+    def __init__(self, connection_limit=settings.AI_CONNECTION_LIMIT,
+                 keepalive_timeout=settings.AI_KEEPALIVE_TIMEOUT,
+                 connect_timeout=settings.AI_CONNECT_TIMEOUT,
+                 total_timeout=settings.AI_TOTAL_TIMEOUT):
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.session = None
+        self.stats = {
+            'requests': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_cache_hits': 0,
+            'dns_cache_misses': 0,
+        }
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="ai-client", daemon=True)
+        self.thread.start()
+        self.submit(self._create_session()).result()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _counter(self, name):
+        async def handler(session, trace_config_ctx, params):
+            self.stats[name] += 1
+        return handler
+
+    async def _create_session(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._counter('requests'))
+        trace_config.on_connection_create_end.append(self._counter('connections_created'))
+        trace_config.on_connection_reuseconn.append(self._counter('connections_reused'))
+        trace_config.on_dns_cache_hit.append(self._counter('dns_cache_hits'))
+        trace_config.on_dns_cache_miss.append(self._counter('dns_cache_misses'))
+
+        connector = aiohttp.TCPConnector(limit=self.connection_limit,
+                                         keepalive_timeout=self.keepalive_timeout,
+                                         ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout,
+                                             trace_configs=[trace_config])
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def connection_stats(self) -> dict:
+        return dict(self.stats)
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        if self.session is not None:
+            self.submit(self.session.close()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AIClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AIClient()
+        return _client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import ai
+import settings
+from ai_client import get_client, close_client
+from StoryObject import StoryObject
+
+
+class RateLimiter:
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second and rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        delay = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def generate_batch(story_objects: list[StoryObject], session=None,
+                         concurrency=settings.BATCH_CONCURRENCY,
+                         rate_per_second=settings.BATCH_RATE_PER_SECOND,
+                         on_result=None, use_cache=settings.AI_CACHE_ENABLED) -> list[tuple]:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rate_per_second)
+
+    async def run_one(index, story_object):
+        story, error = None, story_object.validate()
+        if error is None:
+            async with semaphore:
+                await limiter.wait()
+                try:
+                    story = await ai.get_story_from_ai(story_object, session=session, use_cache=use_cache)
+                except Exception as e:
+                    error = str(e)
+        if on_result:
+            on_result(index, story_object, story, error)
+        return story, error
+
+    return await asyncio.gather(*(run_one(i, obj) for i, obj in enumerate(story_objects)))
+
+
+def load_story_objects(path: str) -> list[StoryObject]:
+    with open(path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    return [StoryObject(
+        description=item.get('description', ''),
+        genre=item.get('genre', 'RPG'),
+        heroes=item.get('heroes', []),
+        mood=item.get('mood', settings.MOODS['default'])
+    ) for item in items]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная генерация историй без графического интерфейса.")
+    parser.add_argument('input', help="JSON-файл со списком параметров историй")
+    parser.add_argument('-o', '--output-dir', default='stories', help="каталог для результатов")
+    parser.add_argument('-c', '--concurrency', type=int, default=settings.BATCH_CONCURRENCY,
+                        help="максимум одновременных запросов")
+    parser.add_argument('-r', '--rate', type=float, default=settings.BATCH_RATE_PER_SECOND,
+                        help="максимум новых запросов в секунду (0 — без ограничения)")
+    parser.add_argument('--no-cache', action='store_true', help="не использовать кэш ответов AI")
+    parser.add_argument('--library', action='store_true', help="сохранять истории в библиотеку")
+    args = parser.parse_args(argv)
+
+    story_objects = load_story_objects(args.input)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def on_result(index, story_object, story, error):
+        if error:
+            print(f"[{index + 1}/{len(story_objects)}] ошибка: {error}", file=sys.stderr)
+            return
+        filename = os.path.join(args.output_dir, f"story_{index + 1:04d}.json")
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(story, f, ensure_ascii=False, indent=2)
+        print(f"[{index + 1}/{len(story_objects)}] {filename}")
+
+    client = get_client()
+    try:
+        results = client.submit(generate_batch(story_objects, session=client.session,
+                                               concurrency=args.concurrency,
+                                               rate_per_second=args.rate,
+                                               on_result=on_result,
+                                               use_cache=not args.no_cache)).result()
+        print(f"Готово: {sum(1 for story, _ in results if story)} из {len(results)}. "
+              f"Соединения: {client.connection_stats()}")
+        if args.library:
+            # соединение SQLite привязано к потоку, поэтому пишем после завершения пакета
+            from storygen.library import get_default_library
+            library = get_default_library()
+            for story_object, (story, _) in zip(story_objects, results):
+                if story:
+                    library.add(story, story_object)
+    finally:
+        close_client()
+    return 0 if all(story for story, _ in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
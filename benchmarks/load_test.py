@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.mock_server import add_server_arguments, server_from_args
+
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def run_load(story_objects, session, concurrency: int, rate: float, stream: bool) -> list:
+    import ai
+    from batch import RateLimiter
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rate)
+
+    async def run_one(story_object):
+        async with semaphore:
+            await limiter.wait()
+            started = time.perf_counter()
+            try:
+                await ai.get_story_from_ai(story_object, on_scene=(lambda scene: None) if stream else None,
+                                           session=session, use_cache=False)
+                error = None
+            except Exception as e:
+                error = str(e)
+            return time.perf_counter() - started, error
+
+    return await asyncio.gather(*(run_one(obj) for obj in story_objects))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load_test',
+                                     description="Нагрузочный тест генерации на локальной замене YandexGPT.")
+    parser.add_argument('-n', '--stories', type=int, default=50, help="число историй")
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help="максимум одновременных генераций")
+    parser.add_argument('-r', '--rate', type=float, default=0.0, help="новых запросов в секунду (0 — без ограничения)")
+    parser.add_argument('--stream', action='store_true', help="потоковый режим, как в графическом интерфейсе")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = server_from_args(args)
+    url = server.start_in_thread()
+    # адрес и ключи должны быть заданы до импорта config
+    os.environ['YANDEX_COMPLETION_URL'] = url
+    os.environ.setdefault('YANDEX_API_KEY', 'mock')
+    os.environ.setdefault('YANDEX_ID_KEY', 'mock')
+
+    import metrics
+    from ai_client import close_client, get_client
+    from StoryObject import StoryObject
+
+    request_durations = []
+    metrics.add_hook(lambda event: request_durations.append(event['duration_ms'])
+                     if event.get('name') == 'ai.request' and 'error' not in event else None)
+
+    story_objects = [StoryObject(f"Нагрузочный тест, история {i + 1}", "RPG", ["Путник"], 'epic')
+                     for i in range(args.stories)]
+    client = get_client()
+    try:
+        started = time.perf_counter()
+        results = client.submit(run_load(story_objects, client.session, args.concurrency,
+                                         args.rate, args.stream)).result()
+        elapsed = time.perf_counter() - started
+        connection_stats = client.connection_stats()
+    finally:
+        close_client()
+        server.stop_thread()
+
+    durations = [duration for duration, error in results if error is None]
+    errors = [error for _, error in results if error is not None]
+    counters = metrics.counters()
+    print(f"Историй: {len(results)}, успешно: {len(durations)}, ошибок: {len(errors)}")
+    print(f"Время: {elapsed:.2f} с, пропускная способность: {len(durations) / elapsed:.2f} историй/с")
+    if durations:
+        print(f"Генерация истории: медиана {statistics.median(durations):.2f} с, "
+              f"p95 {_percentile(durations, 0.95):.2f} с, макс. {max(durations):.2f} с")
+    if request_durations:
+        print(f"Запрос к AI: медиана {statistics.median(request_durations):.0f} мс, "
+              f"p95 {_percentile(request_durations, 0.95):.0f} мс")
+    print(f"Повторов: {counters.get('ai.retries', 0)}, токенов: {counters.get('ai.input_tokens', 0)} + "
+          f"{counters.get('ai.completion_tokens', 0)}")
+    print(f"Сервер: {server.stats}")
+    print(f"Соединения: {connection_stats}")
+    for error in sorted(set(errors))[:5]:
+        print(f"Ошибка: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
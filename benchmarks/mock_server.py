@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import threading
+
+from aiohttp import web
+
+from benchmarks.synthetic import MALFORMED_KINDS, corrupt, generate_scenes, render_response
+
+COMPLETION_PATH = "/foundationModels/v1/completion"
+
+
+def load_responses(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path])
+
+    responses = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            responses.append(content); continue
+        # записи кэша ответов, экспортированные истории и готовые массивы сцен
+        if isinstance(data, dict) and data.get('raw'):
+            responses.append(data['raw'])
+        elif isinstance(data, dict) and 'scenes' in data:
+            responses.append(json.dumps(data['scenes'], ensure_ascii=False, indent=2))
+        else:
+            responses.append(content)
+    return responses
+
+
+class MockCompletionServer:
+    def __init__(self, responses: list[str], latency: float = 0.0, jitter: float = 0.0,
+                 chunk_size: int = 200, chunk_delay: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, malformed_rate: float = 0.0, seed: int = 0):
+        if not responses:
+            raise ValueError("Нужен хотя бы один ответ для воспроизведения.")
+        self.responses = responses
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self.stats = {'requests': 0, 'streamed': 0, 'errors': 0, 'malformed': 0, 'active': 0, 'peak_active': 0}
+        self.url = None
+        self._runner = None
+        self._loop = None
+        self._thread = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(COMPLETION_PATH, self.handle_completion)
+        return app
+
+    def _result(self, text: str, prompt_chars: int, final: bool) -> dict:
+        return {'result': {
+            'alternatives': [{
+                'message': {'role': 'assistant', 'text': text},
+                'status': 'ALTERNATIVE_STATUS_FINAL' if final else 'ALTERNATIVE_STATUS_PARTIAL',
+            }],
+            # приблизительно: около четырёх символов на токен
+            'usage': {'inputTextTokens': str(prompt_chars // 4), 'completionTokens': str(len(text) // 4),
+                      'totalTokens': str((prompt_chars + len(text)) // 4)},
+            'modelVersion': 'mock',
+        }}
+
+    async def handle_completion(self, request: web.Request) -> web.StreamResponse:
+        number = self.stats['requests']
+        self.stats['requests'] += 1
+        self.stats['active'] += 1
+        self.stats['peak_active'] = max(self.stats['peak_active'], self.stats['active'])
+        # отдельный генератор на каждый запрос: результат не зависит от порядка их обработки
+        rng = random.Random(f"{self.seed}:{number}")
+        try:
+            if not request.headers.get('Authorization'):
+                return web.json_response({'error': {'message': 'Unauthorized'}}, status=401)
+            prompt = await request.json()
+            await asyncio.sleep(max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter)))
+
+            if rng.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return web.json_response({'error': {'message': 'Injected error'}}, status=self.error_status)
+
+            text = self.responses[number % len(self.responses)]
+            if rng.random() < self.malformed_rate:
+                self.stats['malformed'] += 1
+                text = corrupt(text, rng.choice(MALFORMED_KINDS))
+            prompt_chars = sum(len(m.get('text', '')) for m in prompt.get('messages', []))
+
+            if not prompt.get('completionOptions', {}).get('stream'):
+                return web.json_response(self._result(text, prompt_chars, final=True))
+
+            self.stats['streamed'] += 1
+            response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+            await response.prepare(request)
+            # как и YandexGPT, каждая строка содержит весь накопленный текст
+            for end in range(self.chunk_size, len(text) + self.chunk_size, self.chunk_size):
+                line = json.dumps(self._result(text[:end], prompt_chars, final=end >= len(text)), ensure_ascii=False)
+                await response.write(line.encode('utf-8') + b"\n")
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+            await response.write_eof()
+            return response
+        finally:
+            self.stats['active'] -= 1
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        self.url = f"http://{bound_host}:{bound_port}{COMPLETION_PATH}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        # свой цикл событий, чтобы сервер не делил поток с проверяемым клиентом
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.start(host, port))
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='mock-yandexgpt', daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self.url
+
+    def stop_thread(self):
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--responses', nargs='*', default=[],
+                        help="записанные ответы: файлы или каталоги (кэш ответов AI, экспортированные истории)")
+    parser.add_argument('--scenes', type=int, default=12, help="число сцен в синтетическом ответе")
+    parser.add_argument('--latency', type=float, default=0.5, help="задержка ответа, с")
+    parser.add_argument('--jitter', type=float, default=0.0, help="разброс задержки, с")
+    parser.add_argument('--chunk-size', type=int, default=200, help="символов в одном фрагменте потока")
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help="пауза между фрагментами потока, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов с ошибкой")
+    parser.add_argument('--error-status', type=int, default=503, help="HTTP-статус ошибки")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="доля ответов с повреждённым JSON")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def server_from_args(args) -> MockCompletionServer:
+    responses = load_responses(args.responses) or [render_response(generate_scenes(args.scenes, seed=args.seed))]
+    return MockCompletionServer(responses, latency=args.latency, jitter=args.jitter, chunk_size=args.chunk_size,
+                                chunk_delay=args.chunk_delay, error_rate=args.error_rate,
+                                error_status=args.error_status, malformed_rate=args.malformed_rate, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.mock_server',
+                                     description="Локальная замена YandexGPT для нагрузочного тестирования.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = server_from_args(args)
+    print(f"YANDEX_COMPLETION_URL=http://{args.host}:{args.port}{COMPLETION_PATH}")
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
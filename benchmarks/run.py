@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks.synthetic import MALFORMED_KINDS, generate_scenes, render_response, story_object
+from storygen.analysis import StoryAnalysis
+from storygen.convert import convert_ai_array_to_graph_format
+from storygen.parsing import clean_json_response, parse_scenes_with_fragments
+from storygen.storage import load_story, save_story
+
+DEFAULT_SIZES = (50, 500, 2000)
+EVENTS_PER_RUN = 200
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': statistics.median(samples), 'min_ms': min(samples), 'repeat': repeat}
+
+
+def bench_pure(n: int, repeat: int, results: dict):
+    scenes = generate_scenes(n, cycles=max(1, n // 50), unreachable=max(1, n // 20))
+    response = render_response(scenes)
+    results[f"parse.clean_json/{n}"] = measure(lambda: clean_json_response(response), repeat)
+    for kind in MALFORMED_KINDS:
+        broken = render_response(scenes, kind)
+        results[f"parse.{kind}/{n}"] = measure(lambda: parse_scenes_with_fragments(broken), repeat)
+
+    so = story_object()
+    results[f"convert/{n}"] = measure(lambda: convert_ai_array_to_graph_format(scenes, so), repeat)
+    story = convert_ai_array_to_graph_format(scenes, so)
+    results[f"analysis/{n}"] = measure(lambda: StoryAnalysis(story), repeat)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'story.gsg')
+        results[f"storage.save/{n}"] = measure(lambda: save_story(story, path), repeat)
+        results[f"storage.load/{n}"] = measure(lambda: load_story(path), repeat)
+    return story
+
+
+def _graph_canvas():
+    # без дисплея: Qt рисует в память, matplotlib - через Agg внутри FigureCanvasQTAgg
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    from story_graph import StoryGraph
+    graph = StoryGraph()
+    graph.resize(1200, 900)
+    return app, graph
+
+
+def bench_graph(graph, story: dict, n: int, repeat: int, results: dict):
+    import story_graph
+    from storygen import analysis
+
+    def clear_caches():
+        story_graph._layout_cache.clear()
+        analysis._analysis_cache.clear()
+
+    from graph_prepare import prepare_story
+    results[f"graph.prepare/{n}"] = measure(lambda: prepare_story(story), repeat, clear_caches)
+    results[f"graph.update_graph/{n}"] = measure(lambda: graph.update_graph(story), repeat, clear_caches)
+    results[f"graph.layout/{n}"] = measure(graph._custom_hierarchical_layout, repeat, story_graph._layout_cache.clear)
+    results[f"graph.redraw/{n}"] = measure(graph.redraw_graph, repeat)
+
+    rng = random.Random(0)
+    event = SimpleNamespace(inaxes=graph.ax, x=0, y=0, xdata=0.0, ydata=0.0, button=1)
+    if len(graph.edge_list):
+        midpoints = graph.edge_samples[:, graph.edge_samples.shape[1] // 2]
+        hover_points = midpoints[[rng.randrange(len(midpoints)) for _ in range(EVENTS_PER_RUN)]]
+        hover_points = hover_points + [(rng.uniform(-0.3, 0.3), rng.uniform(-0.3, 0.3)) for _ in hover_points]
+
+        def hover():
+            for event.xdata, event.ydata in hover_points:
+                graph.on_hover(event)
+        results[f"graph.hover/{n}"] = measure(hover, repeat)
+
+    click_points = graph.node_xy[[rng.randrange(len(graph.node_ids)) for _ in range(EVENTS_PER_RUN)]]
+
+    def click():
+        for event.xdata, event.ydata in click_points:
+            # повторный клик по выделенной сцене открыл бы модальное окно
+            graph.selected_node = None
+            graph.on_click(event)
+    results[f"graph.click/{n}"] = measure(click, repeat)
+
+    def zoom():
+        (x0, x1), (y0, y1) = graph.ax.get_xlim(), graph.ax.get_ylim()
+        event.xdata, event.ydata = (x0 + x1) / 2, (y0 + y1) / 2
+        for button in ('up',) * 5 + ('down',) * 5:
+            event.button = button
+            graph.on_scroll(event)
+        event.button = 1
+    results[f"graph.zoom/{n}"] = measure(zoom, repeat)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base and stats['median_ms'] > base['median_ms'] * threshold:
+            regressions.append((name, base['median_ms'], stats['median_ms']))
+    return regressions
+
+
+def print_table(results: dict, baseline: dict = None):
+    for name, stats in results.items():
+        line = f"{name:32} {stats['median_ms']:10.2f} мс  (мин. {stats['min_ms']:.2f})"
+        base = (baseline or {}).get('results', {}).get(name)
+        if base:
+            line += f"  база {base['median_ms']:.2f} мс, x{stats['median_ms'] / base['median_ms']:.2f}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                     description="Замеры разбора, конвертации, раскладки и отрисовки на синтетических историях.")
+    parser.add_argument('-s', '--sizes', default=",".join(map(str, DEFAULT_SIZES)),
+                        help="число сцен через запятую")
+    parser.add_argument('-r', '--repeat', type=int, default=5, help="повторов на замер")
+    parser.add_argument('--no-gui', action='store_true', help="пропустить замеры StoryGraph")
+    parser.add_argument('--save-baseline', metavar='FILE', help="сохранить результаты как базовые")
+    parser.add_argument('--compare', metavar='FILE', help="сравнить с сохранёнными базовыми результатами")
+    parser.add_argument('--threshold', type=float, default=1.3,
+                        help="во сколько раз медиана может превысить базовую (по умолчанию 1.3)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    graph = None
+    if not args.no_gui:
+        try:
+            app, graph = _graph_canvas()
+        except ImportError as e:
+            print(f"Замеры StoryGraph пропущены: {e}", file=sys.stderr)
+
+    results = {}
+    for n in sizes:
+        story = bench_pure(n, args.repeat, results)
+        if graph is not None:
+            bench_graph(graph, story, n, args.repeat, results)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        meta = {'python': platform.python_version(), 'platform': platform.platform(),
+                'machine': platform.machine(), 'created_at': time.time(), 'repeat': args.repeat}
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, current in regressions:
+            print(f"Регрессия: {name}: {base:.2f} → {current:.2f} мс", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import json
+import random
+import re
+
+from StoryObject import StoryObject
+from storygen.convert import convert_ai_array_to_graph_format
+
+MALFORMED_KINDS = ('fenced', 'prose', 'trailing_commas', 'missing_brace', 'truncated')
+
+_WORDS = ("путник", "лес", "замок", "дракон", "тропа", "меч", "туман", "река", "башня", "шёпот",
+          "старый", "тёмный", "древний", "светлый", "идёт", "видит", "слышит", "находит", "ждёт", "зовёт")
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate_scenes(scene_count: int, branching: int = 2, cycles: int = 0, unreachable: int = 0,
+                    text_words: int = 60, window: int = 8, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    reachable_count = max(1, scene_count - unreachable)
+    targets = {i: [] for i in range(1, scene_count + 1)}
+
+    # у каждой достижимой сцены есть родитель среди предыдущих, поэтому из сцены 1 достижимы все
+    for j in range(2, reachable_count + 1):
+        targets[rng.randint(max(1, j - window), j - 1)].append(j)
+    for i in range(1, reachable_count + 1):
+        upper = min(reachable_count, i + window)
+        while len(targets[i]) < branching and i < upper and rng.random() < 0.7:
+            j = rng.randint(i + 1, upper)
+            if j not in targets[i]:
+                targets[i].append(j)
+
+    for _ in range(cycles):
+        i = rng.randint(2, reachable_count) if reachable_count > 1 else 1
+        targets[i].append(rng.randint(1, i))
+
+    # недостижимые «острова» связаны только между собой
+    for i in range(reachable_count + 1, scene_count):
+        targets[i].append(i + 1)
+
+    return [{
+        'scene_id': str(i),
+        'text': _text(rng, text_words),
+        'choices': [{'text': _text(rng, 4), 'next_scene': str(j)} for j in targets[i]],
+        'is_ending': not targets[i],
+    } for i in range(1, scene_count + 1)]
+
+
+def story_object() -> StoryObject:
+    return StoryObject("Синтетический квест для замеров производительности", "RPG", ["Путник"], 'epic')
+
+
+def generate_story(scene_count: int, **kwargs) -> dict:
+    return convert_ai_array_to_graph_format(generate_scenes(scene_count, **kwargs), story_object())
+
+
+def corrupt(text: str, kind: str) -> str:
+    if kind == 'fenced':
+        return f"```json\n{text}\n```"
+    if kind == 'prose':
+        return f"Вот ваша история:\n{text}\nНадеюсь, она понравится!"
+    if kind == 'trailing_commas':
+        return re.sub(r'([}\]])(\s*[}\]])', r'\1,\2', text)
+    if kind == 'missing_brace':
+        # убираем закрывающую скобку у одной из сцен в середине массива
+        match = re.compile(r'}\s*,\s*{').search(text, len(text) // 2)
+        return text[:match.start()] + ", {" + text[match.end():] if match else text
+    if kind == 'truncated':
+        return text[:int(len(text) * 0.9)]
+    raise ValueError(f"Неизвестный вид повреждения: {kind}")
+
+
+def render_response(scenes: list[dict], kind: str = None) -> str:
+    text = json.dumps(scenes, ensure_ascii=False, indent=2)
+    return text if kind is None else corrupt(text, kind)
@@ -3,4 +3,5 @@ from dotenv import load_dotenv
 
 load_dotenv()
 YANDEX_ID_KEY = os.getenv("YANDEX_ID_KEY")
-YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
\ No newline at end of file
+YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
+YANDEX_COMPLETION_URL = os.getenv("YANDEX_COMPLETION_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1/completion")
\ No newline at end of file
@@ -0,0 +1,173 @@
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import networkx as nx
+import numpy as np
+
+import metrics
+import settings
+from cache import graph_key
+from storygen.analysis import analyze_story
+from storygen.compact import CompactStory
+
+logger = logging.getLogger(__name__)
+
+X_SPACING = 2.0
+Y_SPACING = -2.0
+
+_executor = None
+_thread_executor = None
+
+
+class PreparedStory:
+    def __init__(self, story, analysis, graph, layout_key, node_ids, xy):
+        self.story = story
+        self.analysis = analysis
+        self.graph = graph
+        self.layout_key = layout_key
+        self.node_ids = node_ids
+        self.xy = xy
+
+
+def build_story_graph(story: CompactStory) -> nx.DiGraph:
+    graph = nx.DiGraph()
+    scene_id = story.scene_id
+    graph.add_nodes_from(scene_id(i) for i in range(len(story)))
+    graph.add_edges_from((scene_id(source), scene_id(target)) for source, target, _ in story.edges())
+    return graph
+
+
+def layout_key(graph: nx.DiGraph, start_node) -> str:
+    return graph_key(graph.nodes(), graph.edges(), start_node)
+
+
+def level_positions(count: int, level: int) -> np.ndarray:
+    xy = np.empty((count, 2))
+    xy[:, 0] = (np.arange(count) - (count - 1) / 2) * X_SPACING
+    xy[:, 1] = level * Y_SPACING
+    return xy
+
+
+def unreachable_positions(graph: nx.DiGraph, nodes: list, max_level: int) -> np.ndarray:
+    center_y = (max_level + 2) * Y_SPACING
+    sub_pos = nx.spring_layout(graph.subgraph(nodes), seed=42, scale=len(nodes), center=(0, center_y))
+    return np.array([sub_pos[node] for node in nodes], dtype=float).reshape(-1, 2)
+
+
+def compute_hierarchical_layout(graph: nx.DiGraph, levels: dict):
+    node_ids = list(graph.nodes())
+    xy = np.zeros((len(node_ids), 2))
+
+    level_of = np.array([levels.get(node, -1) for node in node_ids], dtype=np.int64)
+    reachable_rows = np.flatnonzero(level_of >= 0)
+
+    if len(reachable_rows):
+        # внутри уровня сцены идут по имени и центрируются относительно x = 0
+        names = np.array(node_ids)[reachable_rows]
+        order = reachable_rows[np.lexsort((names, level_of[reachable_rows]))]
+        node_levels = level_of[order]
+        counts = np.bincount(node_levels)
+        rank = np.arange(len(order)) - (np.cumsum(counts) - counts)[node_levels]
+        xy[order, 0] = (rank - (counts[node_levels] - 1) / 2) * X_SPACING
+        xy[order, 1] = node_levels * Y_SPACING
+        max_level = int(node_levels.max())
+    else:
+        max_level = -1
+
+    unreachable_rows = np.flatnonzero(level_of < 0)
+    if len(unreachable_rows):
+        xy[unreachable_rows] = unreachable_positions(graph, [node_ids[row] for row in unreachable_rows], max_level)
+
+    return node_ids, xy
+
+
+def prepare_story(story_data) -> PreparedStory:
+    with metrics.span('graph.prepare') as current:
+        story = story_data if isinstance(story_data, CompactStory) else CompactStory.from_dict(story_data)
+        analysis = analyze_story(story)
+        graph = build_story_graph(story)
+        node_ids, xy = compute_hierarchical_layout(graph, analysis.levels) if len(story) else ([], np.empty((0, 2)))
+        current['scenes'] = len(story)
+        return PreparedStory(story, analysis, graph, layout_key(graph, story.get('start_scene')), node_ids, xy)
+
+
+def story_size(story_data) -> int:
+    return len(story_data) if isinstance(story_data, CompactStory) else len(story_data.get('scenes', []))
+
+
+def get_executor() -> ProcessPoolExecutor:
+    # пул создаётся только для первой большой истории: квесты из одного запроса в него не попадают
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: в процессе уже работают потоки Qt и клиента AI
+        _executor = ProcessPoolExecutor(max_workers=settings.PREPARE_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def get_thread_executor() -> ThreadPoolExecutor:
+    global _thread_executor
+    if _thread_executor is None:
+        _thread_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='graph-prepare')
+    return _thread_executor
+
+
+def _copy_result(source: Future, target: Future):
+    try:
+        target.set_result(source.result())
+    except Exception as e:
+        target.set_exception(e)
+
+
+def _prepare_in_thread(story_data, target: Future):
+    get_thread_executor().submit(prepare_story, story_data).add_done_callback(lambda f: _copy_result(f, target))
+
+
+def _on_pool_done(story_data, source: Future, target: Future):
+    try:
+        target.set_result(source.result())
+        return
+    except Exception as e:
+        error = e
+    # упавший процесс или ошибка пересылки: готовим в потоке, чтобы не занимать главный поток интерфейса
+    logger.warning("Подготовка истории в отдельном процессе не удалась, повтор в потоке", exc_info=error)
+    if isinstance(error, BrokenProcessPool):
+        reset_executor()
+    _prepare_in_thread(story_data, target)
+
+
+def submit_prepare(story_data) -> Future:
+    future = Future()
+    if story_size(story_data) < settings.PREPARE_POOL_MIN_SCENES:
+        # для небольших историй пересылка между процессами дороже самой подготовки
+        try:
+            future.set_result(prepare_story(story_data))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    try:
+        pool_future = get_executor().submit(prepare_story, story_data)
+    except (BrokenProcessPool, RuntimeError) as e:
+        logger.warning("Пул подготовки историй недоступен, подготовка в потоке", exc_info=e)
+        reset_executor()
+        _prepare_in_thread(story_data, future)
+        return future
+    pool_future.add_done_callback(lambda f: _on_pool_done(story_data, f, future))
+    return future
+
+
+def reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def shutdown_executor():
+    global _thread_executor
+    reset_executor()
+    if _thread_executor is not None:
+        _thread_executor.shutdown(wait=False, cancel_futures=True)
+        _thread_executor = None
@@ -1,17 +1,85 @@
+import logging
+
 from PyQt5.QtWidgets import (
     QWidget, QLabel, QTextEdit, QPushButton, QVBoxLayout, QHBoxLayout,
-    QComboBox, QScrollArea, QFrame, QSizePolicy, QMessageBox, QSplitter
+    QComboBox, QScrollArea, QFrame, QSizePolicy, QMessageBox, QSplitter,
+    QDialog, QLineEdit, QListWidget, QListWidgetItem
 )
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont
 
-from story_graph import StoryGraph
 import settings
 from gui_style import style
 from StoryObject import StoryObject
 
+logger = logging.getLogger(__name__)
+
+class LibraryDialog(QDialog):
+    def __init__(self, library, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.selected_story_id = None
+        self.setWindowTitle("Библиотека историй")
+        self.setMinimumSize(700, 500)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.refresh)
+
+        layout = QVBoxLayout(self)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Поиск по названиям и текстам сцен...")
+        self.search_input.textChanged.connect(self.search_timer.start)
+        layout.addWidget(self.search_input)
+
+        self.results = QListWidget()
+        self.results.itemDoubleClicked.connect(self.open_selected)
+        layout.addWidget(self.results, 1)
+
+        button_layout = QHBoxLayout()
+        self.count_label = QLabel("", objectName="infoLabel")
+        button_layout.addWidget(self.count_label)
+        button_layout.addStretch()
+        self.open_button = QPushButton("Открыть", objectName="actionButton")
+        self.open_button.clicked.connect(self.open_selected)
+        button_layout.addWidget(self.open_button)
+        close_button = QPushButton("Закрыть", objectName="actionButton")
+        close_button.clicked.connect(self.reject)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.refresh()
+
+    def refresh(self):
+        self.results.clear()
+        query = self.search_input.text().strip()
+        if query:
+            rows = [(row['story_id'], f"{row['title'] or 'Без названия'} — сцена {row['scene_id'] or '-'}\n{row['snippet']}")
+                    for row in self.library.search(query)]
+        else:
+            rows = [(row['id'], f"{row['title'] or 'Без названия'} ({row['scene_count']} сцен)")
+                    for row in self.library.stories()]
+        for story_id, text in rows:
+            item = QListWidgetItem(text)
+            item.setData(Qt.UserRole, story_id)
+            self.results.addItem(item)
+        self.count_label.setText(f"Найдено: {len(rows)} из {len(self.library)}" if query else f"Историй: {len(self.library)}")
+
+    def open_selected(self, *_):
+        item = self.results.currentItem()
+        if item is None: return
+        self.selected_story_id = item.data(Qt.UserRole)
+        self.accept()
+
+
 class MainWindow(QWidget):
     storyRequested = pyqtSignal(StoryObject)
+    cancelRequested = pyqtSignal()
+    firstPainted = pyqtSignal()
+    graphCanvasReady = pyqtSignal()
+    storyPrepared = pyqtSignal(object)
+    sceneRegenerationRequested = pyqtSignal(StoryObject, object)
 
     def __init__(self):
         super().__init__()
@@ -19,8 +87,20 @@ class MainWindow(QWidget):
         self.setGeometry(100, 100, 1600, 900)
         self.setStyleSheet(style)
         self.current_story = None
+        self.graph_canvas = None
+        self._prepare_generation = 0
+        self.storyPrepared.connect(self._on_story_prepared)
+        self._painted = False
         self.init_ui()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._painted:
+            self._painted = True
+            self.firstPainted.emit()
+            if settings.GRAPH_CANVAS_PRELOAD_MS >= 0:
+                QTimer.singleShot(settings.GRAPH_CANVAS_PRELOAD_MS, self.ensure_graph_canvas)
+
     def init_ui(self):
         main_layout = QHBoxLayout(self)
         main_layout.setContentsMargins(0, 0, 0, 0)
@@ -70,6 +150,12 @@ class MainWindow(QWidget):
         self.generate_btn.setMinimumHeight(50)
         self.generate_btn.clicked.connect(self.on_generate_button_clicked)
         left_layout.addWidget(self.generate_btn)
+
+        self.cancel_btn = QPushButton("Отменить генерацию", objectName="actionButton")
+        self.cancel_btn.setMinimumHeight(40)
+        self.cancel_btn.setVisible(False)
+        self.cancel_btn.clicked.connect(self.cancelRequested)
+        left_layout.addWidget(self.cancel_btn)
         
         scroll_area.setWidget(content_widget)
         main_left_layout = QVBoxLayout(self.left_container)
@@ -88,10 +174,17 @@ class MainWindow(QWidget):
         self.info_label = QLabel("Заполните параметры и сгенерируйте историю.", objectName="infoLabel")
         header_layout.addWidget(self.info_label)
         
-        self.graph_canvas = StoryGraph()
+        self.graph_placeholder = QLabel("Ожидание генерации истории...", objectName="infoLabel")
+        self.graph_placeholder.setAlignment(Qt.AlignCenter)
         
         footer_layout = QHBoxLayout()
-        self.export_btn = QPushButton("Экспорт в JSON", objectName="actionButton")
+        self.open_btn = QPushButton("Открыть историю", objectName="actionButton")
+        self.open_btn.clicked.connect(self.open_story)
+        footer_layout.addWidget(self.open_btn)
+        self.library_btn = QPushButton("Библиотека", objectName="actionButton")
+        self.library_btn.clicked.connect(self.open_library)
+        footer_layout.addWidget(self.library_btn)
+        self.export_btn = QPushButton("Экспорт истории", objectName="actionButton")
         self.export_btn.setEnabled(False)
         self.export_btn.clicked.connect(self.export_story)
         footer_layout.addWidget(self.export_btn)
@@ -100,8 +193,26 @@ class MainWindow(QWidget):
         footer_layout.addWidget(self.stats_label)
         
         right_layout.addLayout(header_layout)
-        right_layout.addWidget(self.graph_canvas, 1)
+        right_layout.addWidget(self.graph_placeholder, 1)
         right_layout.addLayout(footer_layout)
+        self.right_layout = right_layout
+
+    def _on_story_edited(self):
+        self.current_story = self.graph_canvas.story
+        self.stats_label.setText(self.graph_canvas.get_graph_statistics())
+
+    def ensure_graph_canvas(self):
+        if self.graph_canvas is None:
+            # matplotlib и networkx загружаются только когда холст действительно нужен
+            from story_graph import StoryGraph
+            self.graph_canvas = StoryGraph()
+            self.graph_canvas.storyEdited.connect(self._on_story_edited)
+            self.graph_canvas.regenerateRequested.connect(self.request_scene_regeneration)
+            self.right_layout.replaceWidget(self.graph_placeholder, self.graph_canvas)
+            self.graph_placeholder.deleteLater()
+            self.graph_placeholder = None
+            self.graphCanvasReady.emit()
+        return self.graph_canvas
         
     def _create_labeled_widget(self, widget_class, label_text, height=None):
         container = QWidget()
@@ -131,13 +242,16 @@ class MainWindow(QWidget):
             
         return container
 
-    def on_generate_button_clicked(self):
-        story_obj = StoryObject(
+    def _story_object_from_form(self):
+        return StoryObject(
             description=self.desc_input.widget.toPlainText(),
             genre=self.genre_input.widget.toPlainText(),
             heroes=[h.strip() for h in self.heroes_input.widget.toPlainText().split(';')],
             mood=self.mood_combo.widget.currentData()
         )
+
+    def on_generate_button_clicked(self):
+        story_obj = self._story_object_from_form()
         
         error_msg = story_obj.validate()
         if error_msg:
@@ -147,40 +261,137 @@ class MainWindow(QWidget):
         self.set_ui_for_generation(True)
         self.storyRequested.emit(story_obj)
 
-    def set_story_data(self, story_data):
+    def present_story(self, story_data, message="История сгенерирована."):
+        # анализ и раскладка идут в фоновом процессе, главный поток только рисует готовый результат
+        from graph_prepare import submit_prepare
+        self._prepare_generation += 1
+        generation = self._prepare_generation
+        self.info_label.setText("Подготовка схемы сюжета...")
+        future = submit_prepare(story_data)
+        future.add_done_callback(lambda f: self.storyPrepared.emit((generation, story_data, f, message)))
+
+    def _on_story_prepared(self, payload):
+        generation, story_data, future, message = payload
+        if generation != self._prepare_generation:
+            return
+        try:
+            prepared = future.result()
+        except Exception as e:
+            # сбой пула submit_prepare уже обошёл повтором в потоке: здесь ошибка в самих данных истории
+            logger.exception("Не удалось подготовить схему сюжета")
+            self.handle_generation_error(f"Не удалось подготовить схему сюжета: {e}")
+            return
+        self.set_story_data(story_data, prepared)
+        self.info_label.setText(message)
+
+    def set_story_data(self, story_data, prepared=None):
         self.current_story = story_data
-        self.graph_canvas.update_graph(story_data)
+        graph_canvas = self.ensure_graph_canvas()
+        graph_canvas.update_graph(story_data, prepared)
         self.info_label.setText(f"История сгенерирована.")
-        self.stats_label.setText(self.graph_canvas.get_graph_statistics())
+        self.stats_label.setText(graph_canvas.get_graph_statistics())
         self.export_btn.setEnabled(True)
         self.set_ui_for_generation(False)
 
+    def set_partial_story_data(self, story_data):
+        graph_canvas = self.ensure_graph_canvas()
+        graph_canvas.update_graph(story_data)
+        self.info_label.setText(f"Получено сцен: {len(story_data.get('scenes', []))}...")
+        self.stats_label.setText(graph_canvas.get_graph_statistics())
+
     def handle_generation_error(self, message):
         self.show_message("Ошибка генерации", message, QMessageBox.Critical)
-        self.graph_canvas.draw_empty_graph(f"Ошибка:\n{message}")
+        self.ensure_graph_canvas().draw_empty_graph(f"Ошибка:\n{message}")
         self.info_label.setText("Произошла ошибка.")
         self.stats_label.setText("Статистика: ошибка")
         self.set_ui_for_generation(False)
 
+    def request_scene_regeneration(self, scene_id, subtree):
+        from storygen.regenerate import RegenerationContext
+        graph_canvas = self.graph_canvas
+        try:
+            context = RegenerationContext(graph_canvas.story, scene_id, subtree, graph_canvas.analysis)
+        except ValueError as e:
+            self.show_message("Ошибка перегенерации", str(e), QMessageBox.Warning)
+            return
+        story_obj = self._story_object_from_form()
+        # описание открытой истории точнее полей формы, которые могли измениться после генерации
+        story_obj.description = graph_canvas.story.get('description') or story_obj.description
+        self.info_label.setText(f"Перегенерация сцен: {', '.join(context.scene_ids)}...")
+        self.sceneRegenerationRequested.emit(story_obj, context)
+
+    def apply_regenerated_scenes(self, context, scenes):
+        if self.graph_canvas is None or self.graph_canvas.story is not context.story:
+            return
+        self.graph_canvas.replace_scenes(scenes)
+        self.info_label.setText(f"Перегенерировано сцен: {len(scenes)}.")
+
+    def handle_regeneration_error(self, message):
+        self.show_message("Ошибка перегенерации", message, QMessageBox.Critical)
+        self.info_label.setText("Не удалось перегенерировать сцены.")
+
+    def handle_generation_cancelled(self):
+        self.info_label.setText("Генерация отменена.")
+        self.set_ui_for_generation(False)
+
     def set_ui_for_generation(self, is_generating):
-        self.generate_btn.setEnabled(not is_generating)
-        self.generate_btn.setText("Генерация..." if is_generating else "Сгенерировать историю")
+        # во время генерации кнопка остаётся активной: новый запрос заменяет текущий
+        self.generate_btn.setText("Начать заново" if is_generating else "Сгенерировать историю")
+        self.cancel_btn.setVisible(is_generating)
         if is_generating:
+            # результат предыдущей подготовки больше не нужен
+            self._prepare_generation += 1
             self.info_label.setText("Идёт генерация, пожалуйста, подождите...")
-            self.graph_canvas.draw_empty_graph("Генерация схемы сюжета...")
+            self.ensure_graph_canvas().draw_empty_graph("Генерация схемы сюжета...")
+
+    def open_story(self):
+        from PyQt5.QtWidgets import QFileDialog
+        from storygen.storage import load_story
+
+        filename, _ = QFileDialog.getOpenFileName(self, "Открыть историю", "", "Истории (*.gsg *.json)")
+        if not filename: return
+
+        try:
+            story = load_story(filename)
+        except Exception as e:
+            self.show_message("Ошибка открытия", f"Не удалось открыть файл: {e}", QMessageBox.Critical)
+            return
+        self.present_story(story, "История загружена.")
+
+    def open_library(self):
+        from storygen.library import get_default_library
+
+        try:
+            dialog = LibraryDialog(get_default_library(), parent=self)
+        except Exception as e:
+            self.show_message("Библиотека", f"Не удалось открыть библиотеку: {e}", QMessageBox.Critical)
+            return
+        if dialog.exec_() and dialog.selected_story_id is not None:
+            story = dialog.library.get(dialog.selected_story_id)
+            if story is not None:
+                self.present_story(story, "История открыта из библиотеки.")
 
     def export_story(self):
         if not self.current_story: return
         
         from PyQt5.QtWidgets import QFileDialog
         import json
+        from storygen.compact import CompactStory
+        from storygen.storage import STORY_EXTENSION, save_story
 
-        filename, _ = QFileDialog.getSaveFileName(self, "Сохранить историю", "story.json", "JSON (*.json)")
+        filename, _ = QFileDialog.getSaveFileName(self, "Сохранить историю", "story.json",
+                                                  "JSON (*.json);;Архив истории (*.gsg)")
         
         if filename:
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(self.current_story, f, ensure_ascii=False, indent=2)
+                if filename.endswith(STORY_EXTENSION):
+                    save_story(self.current_story, filename)
+                else:
+                    story_data = self.current_story
+                    if isinstance(story_data, CompactStory):
+                        story_data = story_data.to_dict()
+                    with open(filename, 'w', encoding='utf-8') as f:
+                        json.dump(story_data, f, ensure_ascii=False, indent=2)
                 self.show_message("Экспорт", "История успешно сохранена.", QMessageBox.Information)
             except Exception as e:
                 self.show_message("Ошибка экспорта", f"Не удалось сохранить файл: {e}", QMessageBox.Critical)
@@ -1,29 +1,110 @@
 import sys
+import time
+
+_t_start = time.perf_counter()
+
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtGui import QFont
 
+import settings
 from gui import MainWindow
-from story_generator import StoryGeneratorWorker
 from StoryObject import StoryObject
 
+_t_imports = time.perf_counter()
+
+
+class StartupTimer:
+    def __init__(self, window: MainWindow, t_window: float):
+        self.marks = [("импорт", _t_imports), ("окно", t_window)]
+        window.firstPainted.connect(lambda: self.mark("первая отрисовка"))
+        window.graphCanvasReady.connect(lambda: self.mark("холст графа", report=True))
+
+    def mark(self, name, report=False):
+        self.marks.append((name, time.perf_counter()))
+        if report:
+            self.report()
+
+    def report(self):
+        parts = [f"{name} {(t - _t_start) * 1000:.1f} мс" for name, t in self.marks]
+        print("Запуск: " + "; ".join(parts), file=sys.stderr)
+
 class ApplicationLogic:
     def __init__(self, main_window: MainWindow):
         self.gui = main_window
         self.worker = None
+        self.regeneration_worker = None
+        self.retired_workers = []
         self.gui.storyRequested.connect(self.start_story_generation)
+        self.gui.sceneRegenerationRequested.connect(self.start_scene_regeneration)
+        self.gui.cancelRequested.connect(self.cancel_story_generation)
 
     def start_story_generation(self, story_object: StoryObject):
+        from story_generator import StoryGeneratorWorker
+        # новый запрос вытесняет незавершённый
+        self._retire_worker()
         self.worker = StoryGeneratorWorker(story_object)
-        self.worker.finished.connect(self.gui.set_story_data)
+        self.worker.finished.connect(self.gui.present_story)
+        self.worker.finished.connect(lambda story_data: self.save_to_library(story_data, story_object))
+        self.worker.partial.connect(self.gui.set_partial_story_data)
         self.worker.error.connect(self.gui.handle_generation_error)
+        self.worker.cancelled.connect(self.gui.handle_generation_cancelled)
         self.worker.start()
 
-    def cleanup_on_exit(self):
+    def start_scene_regeneration(self, story_object: StoryObject, context):
+        from story_generator import SceneRegenerationWorker
+        self._retire(self.regeneration_worker)
+        self.regeneration_worker = SceneRegenerationWorker(story_object, context)
+        self.regeneration_worker.finished.connect(lambda scenes: self.gui.apply_regenerated_scenes(context, scenes))
+        self.regeneration_worker.error.connect(self.gui.handle_regeneration_error)
+        self.regeneration_worker.start()
+
+    def save_to_library(self, story_data, story_object):
+        if not settings.LIBRARY_ENABLED:
+            return
+        import sqlite3
+        from storygen.library import get_default_library
+        try:
+            get_default_library().add(story_data, story_object)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Не удалось сохранить историю в библиотеку: {e}", file=sys.stderr)
+
+    def cancel_story_generation(self):
         if self.worker and self.worker.isRunning():
-            self.worker.quit()
-            self.worker.wait()
+            self.worker.cancel()
+
+    def _retire_worker(self):
+        self._retire(self.worker)
+        self.worker = None
+
+    def _retire(self, worker):
+        self.retired_workers = [w for w in self.retired_workers if w.isRunning()]
+        if worker and worker.isRunning():
+            for name in ('finished', 'partial', 'error', 'cancelled'):
+                if hasattr(worker, name):
+                    try:
+                        getattr(worker, name).disconnect()
+                    except TypeError:
+                        pass
+            worker.cancel()
+            self.retired_workers.append(worker)
+
+    def cleanup_on_exit(self):
+        for worker in [self.worker, self.regeneration_worker, *self.retired_workers]:
+            if worker and worker.isRunning():
+                worker.cancel()
+                worker.wait()
+        ai_client = sys.modules.get('ai_client')
+        if ai_client:
+            ai_client.close_client()
+        graph_prepare = sys.modules.get('graph_prepare')
+        if graph_prepare:
+            graph_prepare.shutdown_executor()
 
 def main():
+    startup_timing = '--startup-timing' in sys.argv
+    if startup_timing:
+        sys.argv.remove('--startup-timing')
+
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     
@@ -31,6 +112,8 @@ def main():
     app.setFont(font)
     
     window = MainWindow()
+    if startup_timing:
+        timer = StartupTimer(window, time.perf_counter())
     logic = ApplicationLogic(window)
     window.show()
     
@@ -0,0 +1,130 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+_hooks = []
+_counters = {}
+_lock = threading.Lock()
+_file = None
+_file_path = settings.METRICS_FILE
+
+
+class Span:
+    __slots__ = ('name', 'fields', 'started')
+
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self.fields = fields
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def mark(self, name: str):
+        # фиксируется только первое событие: ttfb, первый фрагмент потока и т. п.
+        self.fields.setdefault(f"{name}_ms", round(self.elapsed_ms(), 3))
+
+    def __setitem__(self, key, value):
+        self.fields[key] = value
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def set_output_file(path):
+    global _file, _file_path
+    with _lock:
+        if _file is not None:
+            _file.close()
+        _file, _file_path = None, path
+
+
+def _write(event: dict):
+    global _file
+    with _lock:
+        if _file is None:
+            _file = open(_file_path, 'a', encoding='utf-8', buffering=1)
+        _file.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+
+def emit(event: dict):
+    event.setdefault('ts', time.time())
+    for hook in list(_hooks):
+        try:
+            hook(event)
+        except Exception:
+            logger.exception("Ошибка в обработчике метрик")
+    if _file_path:
+        try:
+            _write(event)
+        except OSError as e:
+            logger.warning("Не удалось записать метрики в %s: %s", _file_path, e)
+
+
+@contextmanager
+def span(name: str, **fields):
+    current = Span(name, fields)
+    try:
+        yield current
+    except BaseException as e:
+        current.fields['error'] = type(e).__name__
+        raise
+    finally:
+        emit({'type': 'span', 'name': name, 'duration_ms': round(current.elapsed_ms(), 3), **current.fields})
+
+
+def count(name: str, value=1, **fields):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    emit({'type': 'counter', 'name': name, 'value': value, **fields})
+
+
+def counters() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(events) -> dict:
+    durations = {}
+    totals = {}
+    for event in events:
+        if event.get('type') == 'span':
+            durations.setdefault(event['name'], []).append(event['duration_ms'])
+        elif event.get('type') == 'counter':
+            totals[event['name']] = totals.get(event['name'], 0) + event['value']
+    spans = {name: {'count': len(values), 'p50_ms': _percentile(values, 0.5),
+                    'p95_ms': _percentile(values, 0.95), 'max_ms': max(values)}
+             for name, values in durations.items()}
+    return {'spans': spans, 'counters': totals}
+
+
+def read_events(path: str) -> list[dict]:
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
@@ -1,3 +1,5 @@
+import os
+
 MOODS = {
     'default': 'neutral',
     'options': [
@@ -24,4 +26,46 @@ MOODS = {
         {'name': 'Экзистенциальное', 'value': 'existential'},
         {'name': 'Сюрреалистичное', 'value': 'surreal'},
     ]
-}
\ No newline at end of file
+}
+
+LAYOUT_CACHE_SIZE = 64
+ANALYSIS_CACHE_SIZE = 256
+GRAPH_CANVAS_PRELOAD_MS = 300
+GRAPH_DETAIL_NODE_LIMIT = 200
+GRAPH_DETAIL_EDGE_LIMIT = 400
+GRAPH_ZOOM_STEP = 1.2
+PREPARE_WORKERS = 1
+PREPARE_POOL_MIN_SCENES = 150
+AI_STREAMING = True
+
+AI_CONNECTION_LIMIT = 8
+AI_KEEPALIVE_TIMEOUT = 60
+AI_CONNECT_TIMEOUT = 10
+AI_TOTAL_TIMEOUT = 120
+
+AI_RETRY_ATTEMPTS = 4
+AI_RETRY_BASE_DELAY = 1.0
+AI_RETRY_MAX_DELAY = 30.0
+AI_REPAIR_REQUESTS = True
+AI_REPAIR_MAX_CHARS = 20000
+
+CHUNK_BATCH_SIZE = 6
+CHUNK_CONCURRENCY = 4
+OUTLINE_ACT_SCENES = 30
+
+BATCH_CONCURRENCY = 4
+BATCH_RATE_PER_SECOND = 1.0
+
+AI_CACHE_ENABLED = True
+# в интерфейсе повторное нажатие «Сгенерировать» должно давать новый вариант, кэш нужен пакетной генерации и CLI
+AI_CACHE_INTERACTIVE = False
+AI_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'game_story_generator', 'responses')
+AI_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+METRICS_FILE = os.getenv('GSG_METRICS_FILE')
+
+REGENERATE_SUBTREE_LIMIT = 12
+REGENERATE_EXCERPT_CHARS = 300
+
+LIBRARY_ENABLED = True
+LIBRARY_PATH = os.path.join(os.path.expanduser('~'), '.local', 'share', 'game_story_generator', 'library.db')
@@ -0,0 +1,45 @@
+import numpy as np
+
+_STRIDE = np.int64(1) << 32
+
+
+class SpatialGrid:
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.clear()
+
+    def clear(self):
+        self.codes = np.empty(0, dtype=np.int64)
+        self.points = np.empty((0, 2))
+        self.keys = np.empty(0, dtype=np.int64)
+
+    def _cell_codes(self, points):
+        cells = np.floor(np.asarray(points, dtype=float) / self.cell_size).astype(np.int64)
+        return cells[..., 0] * _STRIDE + cells[..., 1]
+
+    def build(self, points, keys=None):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        keys = np.arange(len(points), dtype=np.int64) if keys is None else np.asarray(keys, dtype=np.int64)
+        codes = self._cell_codes(points)
+        order = np.argsort(codes, kind='stable')
+        self.codes, self.points, self.keys = codes[order], points[order], keys[order]
+
+    def nearest(self, x, y, max_dist) -> int:
+        if not len(self.codes):
+            return -1
+        lo = np.floor(np.array([x - max_dist, y - max_dist]) / self.cell_size).astype(np.int64)
+        hi = np.floor(np.array([x + max_dist, y + max_dist]) / self.cell_size).astype(np.int64)
+        cx, cy = np.meshgrid(np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1), indexing='ij')
+        query = (cx * _STRIDE + cy).ravel()
+
+        # точки каждой соседней ячейки лежат в отсортированном массиве подряд
+        starts = np.searchsorted(self.codes, query, 'left')
+        counts = np.searchsorted(self.codes, query, 'right') - starts
+        total = counts.sum()
+        if not total:
+            return -1
+        candidates = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+        dist_sq = ((self.points[candidates] - (x, y)) ** 2).sum(axis=1)
+        best = dist_sq.argmin()
+        return int(self.keys[candidates[best]]) if dist_sq[best] < max_dist ** 2 else -1
@@ -1,29 +1,86 @@
-import asyncio
+from concurrent.futures import CancelledError
 from PyQt5.QtCore import QThread, pyqtSignal
 import ai
+import settings
+from ai_client import get_client
 from StoryObject import StoryObject
 
 class StoryGeneratorWorker(QThread):
     finished = pyqtSignal(dict)
+    partial = pyqtSignal(dict)
     error = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
     def __init__(self, story_object: StoryObject):
         super().__init__()
         self.story_object = story_object
+        self.partial_scenes = []
+        self.future = None
+        self.cancel_requested = False
+
+    def cancel(self):
+        self.cancel_requested = True
+        if self.future is not None:
+            # отмена задачи в цикле клиента сразу обрывает HTTP-запрос
+            self.future.cancel()
+
+    def on_scene(self, scene: dict):
+        self.partial_scenes.append(scene)
+        self.partial.emit(ai.convert_ai_array_to_graph_format(list(self.partial_scenes), self.story_object))
 
     def run(self):
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            story_data = loop.run_until_complete(ai.get_story_from_ai(self.story_object))
+            client = get_client()
+            on_scene = self.on_scene if settings.AI_STREAMING else None
+            if self.cancel_requested:
+                self.cancelled.emit(); return
+            self.future = client.submit(
+                ai.get_story_from_ai(self.story_object, on_scene=on_scene, session=client.session,
+                                     use_cache=settings.AI_CACHE_INTERACTIVE)
+            )
+            if self.cancel_requested:
+                self.future.cancel()
+            story_data = self.future.result()
             
             if story_data:
                 self.finished.emit(story_data)
             else:
                 self.error.emit("AI не вернул результат. Попробуйте изменить запрос.")
                 
+        except CancelledError:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(f"Ошибка: {str(e)}")
+
+class SceneRegenerationWorker(QThread):
+    finished = pyqtSignal(list)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, story_object: StoryObject, context):
+        super().__init__()
+        self.story_object = story_object
+        self.context = context
+        self.future = None
+        self.cancel_requested = False
+
+    def cancel(self):
+        self.cancel_requested = True
+        if self.future is not None:
+            self.future.cancel()
+
+    def run(self):
+        try:
+            client = get_client()
+            if self.cancel_requested:
+                self.cancelled.emit(); return
+            self.future = client.submit(
+                ai.regenerate_scenes_from_ai(self.story_object, self.context, session=client.session)
+            )
+            if self.cancel_requested:
+                self.future.cancel()
+            self.finished.emit(self.future.result())
+        except CancelledError:
+            self.cancelled.emit()
         except Exception as e:
             self.error.emit(f"Ошибка: {str(e)}")
-        finally:
-            loop.close()
\ No newline at end of file
@@ -1,156 +1,31 @@
-import re
 import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QTextEdit, QPushButton,
                              QHBoxLayout, QToolTip)
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtGui import QCursor
 import matplotlib.patches as mpatches
-import aiohttp
-import json
-import re
+from matplotlib.collections import LineCollection
 
-from config import YANDEX_ID_KEY, YANDEX_API_KEY
-from StoryObject import StoryObject
+import metrics
+from graph_prepare import (build_story_graph, compute_hierarchical_layout, layout_key, level_positions,
+                           unreachable_positions)
+from spatial_index import SpatialGrid
+from cache import LRUCache
+from storygen.analysis import StoryAnalysis, analyze_story
+from storygen.compact import CompactStory
+import settings
+
+_layout_cache = LRUCache(settings.LAYOUT_CACHE_SIZE)
+
+EDGE_HIT_RADIUS = 0.1 ** 0.5
+NODE_HIT_RADIUS = 0.5 ** 0.5
+NODE_SIZE = 2500
+NODE_SIZE_COARSE = 80
+PAN_THRESHOLD_PX = 4
 
-def clean_json_response(text: str) -> str:
-    text = re.sub(r'^```(?:json)?\s*', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\s*```$', '', text, flags=re.MULTILINE)
-    text = text.strip()
-    
-    start = text.find('[')
-    end = text.rfind(']')
-    
-    if start == -1 or end == -1 or end <= start:
-        raise json.JSONDecodeError("Не удалось найти валидный JSON-массив в ответе.", text, 0)
-        
-    content = text[start+1:end].strip()
-    
-    fixed_content = re.sub(r'\}\s*\{', '}, {', content, flags=re.DOTALL)
-    
-    return f"[{fixed_content}]"
-
-def convert_ai_array_to_graph_format(scene_list: list[dict], story_object: StoryObject) -> dict:
-    if not scene_list:
-        raise ValueError("AI вернул пустой список сцен.")
-        
-    scene_id_to_id = {}
-    formatted_scenes = []
-    
-    for i, scene_data in enumerate(scene_list):
-        original_scene_id = scene_data.get('scene_id', str(i+1))
-        new_id = str(i+1)
-        scene_id_to_id[original_scene_id] = new_id
-        
-        formatted_scenes.append({
-            'scene_id': new_id,
-            'text': scene_data.get('text', scene_data.get('description', 'Описание отсутствует.')),
-            'choices': [{
-                'text': c.get('text', '...'),
-                'next_scene': c.get('next_scene', c.get('next_scene', ''))
-            } for c in scene_data.get('choices', [])],
-            'is_ending': not scene_data.get('choices', not scene_data.get('is_ending', False))
-        })
-    
-    for scene in formatted_scenes:
-        for choice in scene['choices']:
-            original_next_scene_id = choice['next_scene']
-            if original_next_scene_id in scene_id_to_id:
-                choice['next_scene'] = scene_id_to_id[original_next_scene_id]
-    
-    start_scene_id = scene_id_to_id.get("1", "1")
-    
-    title_text = story_object.description[:50]
-    if len(story_object.description) > 50:
-        title_text += "..."
-        
-    return {
-        'title': title_text,
-        'description': story_object.description,
-        'start_scene': start_scene_id,
-        'scenes': formatted_scenes
-    }
-
-async def get_story_from_ai(story_object: StoryObject) -> dict:
-    if not YANDEX_API_KEY or not YANDEX_ID_KEY:
-        raise ValueError("YANDEX_API_KEY и YANDEX_ID_KEY должны быть установлены в .env файле.")
-
-    prompt = {
-        "modelUri": f"gpt://{YANDEX_ID_KEY}/yandexgpt-lite",
-        "completionOptions": {
-            "stream": False,
-            "temperature": 0.75,
-            "maxTokens": "16000"
-        },
-        "messages": [
-            {
-                "role": "system",
-                "text": """Ты — профессиональный сценарист для RPG.
-                Твоя задача — сгенерировать ЕДИНЫЙ JSON-МАССИВ, где каждый элемент — это одна сцена квеста.
-                
-                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
-                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
-                2.  **СТРУКТУРА ОБЪЕКТА**: Каждый объект в массиве должен иметь СТРОГУЮ структуру:
-                    {
-                      "scene_id": "1",  
-                      "text": "Полное, насыщенное описание сцены (80-150 слов).",
-                      "choices": [
-                        {"text": "Краткое описание выбора (2-5 слов)", "next_scene": "2"}
-                      ]
-                    }
-                3.  **ЗАПЯТЫЕ**: Между КАЖДЫМ объектом в массиве (например, между `}` и `{`) ДОЛЖНА стоять запятая.
-                4.  **ID СЦЕН**: scene_id должны быть последовательными числами от 1 до N в виде строк ("1", "2", "3" и т.д.)
-                5.  **КОНЦОВКИ**: Создай минимум две концовки (сцены без choices)
-                6.  **ВЕТВЛЕНИЕ**: Создай ветвление сюжета с уникальными путями
-                
-                ТРЕБОВАНИЯ К КОНТЕНТУ:
-                -   **Жанр**: Строго Ролевая игра (RPG).
-                -   **Язык**: Русский.
-                -   **Количество сцен**: От 6 до 12.
-                """
-            },
-            {
-                "role": "user",
-                "text": f"""Создай RPG квест по параметрам:
-                - **Описание**: {story_object.description}
-                - **Жанр**: {story_object.genre}
-                - **Персонажи**: {', '.join(story_object.heroes)}
-                - **Настроение**: {story_object.mood}
-                """
-            }
-        ]
-    }
-
-    url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Api-Key {YANDEX_API_KEY}"
-    }
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=prompt, timeout=120) as response:
-                response.raise_for_status()
-                raw_response = await response.text()
-                
-                try:
-                    result_data = json.loads(raw_response)
-                    generated_text = result_data["result"]["alternatives"][0]["message"]["text"]
-                except (json.JSONDecodeError, KeyError):
-                    generated_text = raw_response
-
-                cleaned_json_text = clean_json_response(generated_text)
-                scene_list = json.loads(cleaned_json_text)
-                
-                return convert_ai_array_to_graph_format(scene_list, story_object)
-
-    except aiohttp.ClientError as e:
-        raise ConnectionError(f"Ошибка сети при обращении к AI: {e}")
-    except json.JSONDecodeError as e:
-        raise ValueError(f"AI вернул некорректный JSON, который не удалось исправить. Ошибка: {e}")
-    except Exception as e:
-        raise RuntimeError(f"Неожиданная ошибка при работе с AI: {e}")
 
 class SceneDetailDialog(QDialog):
     def __init__(self, scene_data, parent=None):
@@ -180,49 +55,156 @@ class SceneDetailDialog(QDialog):
         self.text_edit.setText(description_text)
         layout.addWidget(self.text_edit)
 
+        self.regenerate = None
+        self.regenerate_button = QPushButton("Перегенерировать сцену")
+        self.regenerate_button.clicked.connect(lambda: self._request_regeneration(False))
+        self.regenerate_branch_button = QPushButton("Перегенерировать ветку")
+        self.regenerate_branch_button.clicked.connect(lambda: self._request_regeneration(True))
+
         self.close_button = QPushButton("Закрыть")
         self.close_button.clicked.connect(self.accept)
 
         button_layout = QHBoxLayout()
+        button_layout.addWidget(self.regenerate_button)
+        button_layout.addWidget(self.regenerate_branch_button)
         button_layout.addStretch()
         button_layout.addWidget(self.close_button)
         layout.addLayout(button_layout)
 
+    def _request_regeneration(self, subtree):
+        self.regenerate = subtree
+        self.accept()
+
 
 class StoryGraph(FigureCanvas):
+    storyEdited = pyqtSignal()
+    regenerateRequested = pyqtSignal(str, bool)
+
     def __init__(self, parent=None):
         self.fig, self.ax = plt.subplots(figsize=(12, 10), facecolor='#1e1e2d')
         super().__init__(self.fig)
         self.G = nx.DiGraph()
-        self.story_data = {}
-        self.node_positions = {}
-        self.edge_labels = {}
+        self.story = CompactStory()
+        self.analysis = None
         self.selected_node = None
         self.hovered_edge = None
-        self.edge_paths = {}
+        self.node_ids = []
+        self.node_rows = {}
+        self.node_xy = np.empty((0, 2))
+        self.edge_list = []
+        self.edge_rows = {}
+        self.edge_src = self.edge_dst = np.empty(0, dtype=np.int64)
+        self.edge_samples = np.empty((0, 0, 2))
+        self.edge_arcs = np.empty((0, 0, 2))
+        self.node_colors = np.empty(0, dtype=object)
+        self.node_index = SpatialGrid(cell_size=1.0)
+        self.edge_index = SpatialGrid(cell_size=0.5)
         self.press = None
+        self.panned = False
+
+        self.node_collection = None
+        self.edge_collection = None
+        # стрелки и подписи создаются при первом появлении в кадре и дальше только показываются или скрываются
+        self.edge_arrows = {}
+        self.node_labels = {}
+        self.shown_edges = set()
+        self.shown_labels = set()
+        self.detailed = True
+        self._lod_state = None
+        self._pan_background = None
+
+        self.hover_artist = None
+        self.selection_artist = None
+        self._background = None
 
         self.draw_empty_graph("Ожидание генерации истории...")
 
-        self.fig.canvas.mpl_connect('button_press_event', self.on_click)
         self.fig.canvas.mpl_connect('motion_notify_event', self.on_hover)
         self.fig.canvas.mpl_connect('button_press_event', self.on_press)
         self.fig.canvas.mpl_connect('button_release_event', self.on_release)
+        self.fig.canvas.mpl_connect('scroll_event', self.on_scroll)
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
 
     
     def on_press(self, event):
-        if event.inaxes != self.ax:
+        if event.inaxes != self.ax or event.button != 1:
             return
-        self.press = (self.ax.get_xlim(), self.ax.get_ylim(), event.xdata, event.ydata)
-        self.ax.figure.canvas.draw()
-
-
+        self.press = (self.ax.get_xlim(), self.ax.get_ylim(), event.x, event.y)
+        self.panned = False
+        self._pan_background = self._background
 
     def on_release(self, event):
+        if self.press is None:
+            return
         self.press = None
-        self.ax.figure.canvas.draw()
+        self._pan_background = None
+        if self.panned:
+            self.panned = False
+            self._update_level_of_detail()
+            self.draw_idle()
+        else:
+            self.on_click(event)
+
+    def _pan(self, event):
+        (x0, x1), (y0, y1), press_x, press_y = self.press
+        dx, dy = event.x - press_x, event.y - press_y
+        if not self.panned and abs(dx) + abs(dy) < PAN_THRESHOLD_PX:
+            return
+        self.panned = True
+        # сдвиг считаем в пикселях: xdata во время перетаскивания меняется вместе с осями
+        shift_x = dx * (x1 - x0) / self.ax.bbox.width
+        shift_y = dy * (y1 - y0) / self.ax.bbox.height
+        self.ax.set_xlim(x0 - shift_x, x1 - shift_x)
+        self.ax.set_ylim(y0 - shift_y, y1 - shift_y)
+        if self._pan_background is None:
+            self.draw_idle(); return
+        # во время перетаскивания сдвигаем готовую картинку, полная отрисовка - после отпускания кнопки
+        self.ax.draw_artist(self.ax.patch)
+        self.restore_region(self._pan_background, xy=(round(dx), -round(dy)))
+        self._draw_overlays()
+        self.blit(self.fig.bbox)
+
+    def on_scroll(self, event):
+        if event.inaxes != self.ax or not self.node_ids:
+            return
+        factor = 1 / settings.GRAPH_ZOOM_STEP if event.button == 'up' else settings.GRAPH_ZOOM_STEP
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        x, y = event.xdata, event.ydata
+        self.ax.set_xlim(x - (x - x0) * factor, x + (x1 - x) * factor)
+        self.ax.set_ylim(y - (y - y0) * factor, y + (y1 - y) * factor)
+        self._update_level_of_detail()
+        self.draw_idle()
+
+    def on_draw(self, event):
+        self._background = self.copy_from_bbox(self.fig.bbox)
+        self._draw_overlays()
+
+    def _draw_overlays(self):
+        for artist in (self.hover_artist, self.selection_artist):
+            if artist is not None and artist.get_visible():
+                self.ax.draw_artist(artist)
+
+    def _blit_overlays(self):
+        if self._background is None:
+            self.draw_idle(); return
+        self.restore_region(self._background)
+        self._draw_overlays()
+        self.blit(self.fig.bbox)
+
+    def _reset_overlays(self):
+        self.hover_artist = None
+        self.selection_artist = None
+        self._background = None
+        self.node_collection = None
+        self.edge_collection = None
+        self.edge_arrows = {}
+        self.node_labels = {}
+        self.shown_edges = set()
+        self.shown_labels = set()
+        self._lod_state = None
 
     def draw_empty_graph(self, message):
+        self._reset_overlays()
         self.ax.clear()
         self.ax.set_facecolor('#1e1e2d')
         self.ax.text(0.5, 0.5, message, ha='center', va='center',
@@ -230,189 +212,487 @@ class StoryGraph(FigureCanvas):
         self.ax.axis('off')
         self.draw()
 
-    def update_graph(self, story_data):
-        self.story_data = story_data
-        self.G.clear()
-        self.edge_labels.clear()
+    def update_graph(self, story_data, prepared=None):
         self.selected_node = None
         self.hovered_edge = None
+        if prepared is not None:
+            # анализ и раскладка уже посчитаны в фоновом процессе, остаётся только отрисовка
+            self.story, self.analysis, self.G = prepared.story, prepared.analysis, prepared.graph
+            if prepared.node_ids:
+                prepared.xy.setflags(write=False)
+                _layout_cache.put(prepared.layout_key, (prepared.node_ids, prepared.xy))
+        else:
+            if isinstance(story_data, CompactStory):
+                self.story = story_data
+            else:
+                self.story = CompactStory.from_dict(story_data)
+            with metrics.span('story.analyze', scenes=len(self.story)):
+                self.analysis = analyze_story(self.story)
+            self.G = build_story_graph(self.story)
 
-        scenes = story_data.get('scenes', [])
-        if not scenes:
+        if not len(self.story):
             self.draw_empty_graph("В сгенерированной истории нет сцен."); return
 
-        for scene in scenes:
-            self.G.add_node(scene['scene_id'])
-
-        for scene in scenes:
-            for choice in scene.get('choices', []):
-                next_scene_id = choice.get('next_scene')
-                if next_scene_id and self.G.has_node(next_scene_id):
-                    self.G.add_edge(scene['scene_id'], next_scene_id)
-                    self.edge_labels[(scene['scene_id'], next_scene_id)] = choice.get('text', '...')
-
         self.redraw_graph()
 
     def _custom_hierarchical_layout(self):
-        if not self.G.nodes(): return {}
-        start_node = self.story_data.get('start_scene')
-        pos = {}
-        
-        reachable_nodes = set()
-        if start_node and self.G.has_node(start_node):
-            reachable_nodes = set(nx.dfs_preorder_nodes(self.G, start_node))
-
-        if reachable_nodes:
-            subgraph = self.G.subgraph(reachable_nodes)
-            levels = {start_node: 0}
-            queue = [start_node]; head = 0
-            while head < len(queue):
-                u = queue[head]; head += 1
-                for v in sorted(list(subgraph.successors(u))):
-                    if v not in levels:
-                        levels[v] = levels[u] + 1
-                        queue.append(v)
-            
-            nodes_by_level = {}
-            for node, level in levels.items():
-                nodes_by_level.setdefault(level, []).append(node)
-            
-            y_spacing = -2.0; x_spacing = 2.0
-            max_level = max(levels.values()) if levels else 0
-            for level, nodes in sorted(nodes_by_level.items()):
-                width = (len(nodes) - 1) * x_spacing
-                start_x = -width / 2
-                for i, node in enumerate(sorted(nodes)):
-                    pos[node] = (start_x + i * x_spacing, level * y_spacing)
-        else:
-            max_level = -1
-
-        unreachable_nodes = set(self.G.nodes()) - reachable_nodes
-        if unreachable_nodes:
-            subgraph = self.G.subgraph(unreachable_nodes)
-            center_y = (max_level + 2) * -2.0
-            sub_pos = nx.spring_layout(subgraph, seed=42, scale=len(unreachable_nodes), center=(0, center_y))
-            pos.update(sub_pos)
-
-        if len(pos) != len(self.G.nodes()):
-            return nx.spring_layout(self.G, seed=42)
-
-        return pos
+        if not self.G.nodes(): return [], np.empty((0, 2))
+        start_node = self.story.get('start_scene')
+        key = layout_key(self.G, start_node)
+        cached = _layout_cache.get(key)
+        if cached is not None:
+            metrics.count('graph.layout_cache_hits')
+            return cached
+
+        with metrics.span('graph.layout', nodes=self.G.number_of_nodes(), edges=self.G.number_of_edges()):
+            node_ids, xy = self._compute_hierarchical_layout(start_node)
+        xy.setflags(write=False)
+        _layout_cache.put(key, (node_ids, xy))
+        return node_ids, xy
+
+    def _compute_hierarchical_layout(self, start_node):
+        return compute_hierarchical_layout(self.G, self.analysis.levels)
 
     def redraw_graph(self):
+        with metrics.span('graph.redraw', nodes=self.G.number_of_nodes(), edges=self.G.number_of_edges()):
+            self._redraw_graph()
+
+    def _redraw_graph(self):
+        self._reset_overlays()
         self.ax.clear()
         self.ax.set_facecolor('#1e1e2d')
         self.ax.axis('off')
 
         if not self.G.nodes:
             self.draw_empty_graph("Граф пуст."); return
-            
-        self.node_positions = self._custom_hierarchical_layout()
-
-        if self.node_positions:
-            if self.ax.get_xlim() == (0.0, 1.0) and self.ax.get_ylim() == (0.0, 1.0):
-                x_coords, y_coords = zip(*self.node_positions.values())
-                x_margin = (max(x_coords) - min(x_coords)) * 0.1
-                y_margin = (max(y_coords) - min(y_coords)) * 0.1
-                if x_margin < 1: x_margin = 1
-                if y_margin < 1: y_margin = 1
-                self.ax.set_xlim(min(x_coords) - x_margin, max(x_coords) + x_margin)
-                self.ax.set_ylim(min(y_coords) - y_margin, max(y_coords) + y_margin)
-
-        start_node = self.story_data.get('start_scene')
-        end_nodes = [n for n, d in self.G.out_degree() if d == 0]
-        node_colors = ['#51cf66' if n == start_node else '#ff6b6b' if n in end_nodes else '#4dabf7' for n in self.G.nodes()]
-
-        self.edge_paths.clear()
-        for edge in self.G.edges():
-            source, target = edge
-            pos_s = self.node_positions[source]
-            pos_t = self.node_positions[target]
-            
-            edge_color = '#FFD700' if edge == self.hovered_edge else '#aaaaaa'
-            edge_width = 3.0 if edge == self.hovered_edge else 2.0
-
-            arrow = mpatches.FancyArrowPatch(
-                posA=pos_s, posB=pos_t, 
-                connectionstyle=f"arc3,rad=0.1",
-                color=edge_color, 
-                linewidth=edge_width, 
-                arrowstyle='-|>',
-                mutation_scale=30,
-                shrinkA=30,
-                shrinkB=30,
-                alpha=0.8
-            )
-            self.ax.add_patch(arrow)
-            self.edge_paths[edge] = arrow.get_path().vertices
-
-        nx.draw_networkx_nodes(self.G, self.node_positions, ax=self.ax, node_size=2500, 
-                              node_color=node_colors, edgecolors="white", linewidths=1.5)
-        nx.draw_networkx_labels(self.G, self.node_positions, {n: str(n) for n in self.G.nodes()}, 
-                               font_size=11, font_color="white", font_weight="bold")
-
-        if self.selected_node:
-            nx.draw_networkx_nodes(self.G, self.node_positions, nodelist=[self.selected_node], ax=self.ax, node_size=2600, node_color='none', edgecolors='#FFD700', linewidths=3)
 
-        self.draw()
+        self.node_ids, self.node_xy = self._custom_hierarchical_layout()
+        self.node_rows = {node: row for row, node in enumerate(self.node_ids)}
+
+        if self.ax.get_xlim() == (0.0, 1.0) and self.ax.get_ylim() == (0.0, 1.0):
+            lower, upper = self.node_xy.min(axis=0), self.node_xy.max(axis=0)
+            margin = np.maximum((upper - lower) * 0.1, 1)
+            self.ax.set_xlim(lower[0] - margin[0], upper[0] + margin[0])
+            self.ax.set_ylim(lower[1] - margin[1], upper[1] + margin[1])
+
+        self._recolor_nodes()
+
+        self.edge_list = list(self.G.edges())
+        self.edge_rows = {edge: row for row, edge in enumerate(self.edge_list)}
+        self.edge_src = np.array([self.node_rows[s] for s, _ in self.edge_list], dtype=np.int64)
+        self.edge_dst = np.array([self.node_rows[t] for _, t in self.edge_list], dtype=np.int64)
+        pos_s, pos_t = self.node_xy[self.edge_src], self.node_xy[self.edge_dst]
+        self.edge_samples = self._sample_edge_arcs(pos_s, pos_t)
+        self.edge_arcs = self._sample_edge_arcs(pos_s, pos_t, samples=16, t_range=(0.0, 1.0))
+
+        self._rebuild_hit_index()
+
+        self.edge_collection = LineCollection([], colors='#aaaaaa', linewidths=1.5, alpha=0.8, zorder=1)
+        self.ax.add_collection(self.edge_collection, autolim=False)
+        self.node_collection = self.ax.scatter(self.node_xy[:, 0], self.node_xy[:, 1], s=NODE_SIZE,
+                                               c=list(self.node_colors), edgecolors='white',
+                                               linewidths=1.5, zorder=2)
+
+        self.hover_artist = self._make_arrow((0, 0), (0, 0), color='#FFD700', linewidth=3.0)
+        self.hover_artist.set_animated(True)
+        self.ax.add_patch(self.hover_artist)
+        self.selection_artist = self.ax.scatter([0], [0], s=2600, facecolors='none', edgecolors='#FFD700',
+                                                linewidths=3, animated=True, zorder=3)
+        self._update_level_of_detail()
+        self._update_hover_artist()
+        self._update_selection_artist()
+
+        with metrics.span('graph.render', detailed=self.detailed):
+            self.draw()
+
+    def _visible_rows(self):
+        (x0, x1), (y0, y1) = sorted(self.ax.get_xlim()), sorted(self.ax.get_ylim())
+        # запас в половину экрана: при перетаскивании края не пустеют до отпускания кнопки
+        pad_x, pad_y = (x1 - x0) / 2 + 1, (y1 - y0) / 2 + 1
+        x0, x1, y0, y1 = x0 - pad_x, x1 + pad_x, y0 - pad_y, y1 + pad_y
+
+        xy = self.node_xy
+        nodes = (xy[:, 0] >= x0) & (xy[:, 0] <= x1) & (xy[:, 1] >= y0) & (xy[:, 1] <= y1)
+        lower = np.minimum(xy[self.edge_src], xy[self.edge_dst])
+        upper = np.maximum(xy[self.edge_src], xy[self.edge_dst])
+        edges = (lower[:, 0] <= x1) & (upper[:, 0] >= x0) & (lower[:, 1] <= y1) & (upper[:, 1] >= y0)
+        return np.flatnonzero(nodes), np.flatnonzero(edges)
+
+    def _update_level_of_detail(self, force=False):
+        if self.node_collection is None:
+            return
+        node_rows, edge_rows = self._visible_rows()
+        detailed = (len(node_rows) <= settings.GRAPH_DETAIL_NODE_LIMIT and
+                    len(edge_rows) <= settings.GRAPH_DETAIL_EDGE_LIMIT)
+        # запас в _visible_rows обычно оставляет набор видимых сцен прежним при небольшом сдвиге или масштабе
+        state = (detailed, node_rows.tobytes(), edge_rows.tobytes())
+        if not force and state == self._lod_state:
+            return
+        self._lod_state = state
+        self.detailed = detailed
+
+        with metrics.span('graph.lod', visible_nodes=len(node_rows), visible_edges=len(edge_rows),
+                          detailed=detailed) as current:
+            self._apply_level_of_detail(current, node_rows, edge_rows)
+
+    def _apply_level_of_detail(self, current_span, node_rows, edge_rows):
+        node_size = NODE_SIZE if self.detailed else NODE_SIZE_COARSE
+
+        self.node_collection.set_offsets(self.node_xy[node_rows])
+        self.node_collection.set_facecolor(list(self.node_colors[node_rows]))
+        self.node_collection.set_sizes([node_size])
+        if self.selection_artist is not None:
+            self.selection_artist.set_sizes([node_size + 100])
+
+        if self.detailed:
+            self.edge_collection.set_segments([])
+            edges = {self.edge_list[row] for row in edge_rows}
+            labels = {self.node_ids[row] for row in node_rows}
+        else:
+            self.edge_collection.set_segments(self.edge_arcs[edge_rows])
+            edges = labels = set()
+
+        created = len(self.edge_arrows) + len(self.node_labels)
+        for edge in self.shown_edges - edges:
+            self.edge_arrows[edge].set_visible(False)
+        for edge in edges - self.shown_edges:
+            self._edge_arrow(edge).set_visible(True)
+        for node in self.shown_labels - labels:
+            self.node_labels[node].set_visible(False)
+        for node in labels - self.shown_labels:
+            self._node_label(node).set_visible(True)
+        current_span['toggled'] = len(self.shown_edges ^ edges) + len(self.shown_labels ^ labels)
+        current_span['created'] = len(self.edge_arrows) + len(self.node_labels) - created
+        self.shown_edges, self.shown_labels = edges, labels
+
+    def _edge_arrow(self, edge):
+        arrow = self.edge_arrows.get(edge)
+        if arrow is None:
+            row = self.edge_rows[edge]
+            arrow = self._make_arrow(self.node_xy[self.edge_src[row]], self.node_xy[self.edge_dst[row]],
+                                     color='#aaaaaa', linewidth=2.0)
+            # add_artist, а не add_patch: пересчёт границ данных на каждую стрелку не нужен, пределы осей заданы
+            self.ax.add_artist(arrow)
+            self.edge_arrows[edge] = arrow
+        return arrow
+
+    def _node_label(self, node):
+        label = self.node_labels.get(node)
+        if label is None:
+            x, y = self.node_xy[self.node_rows[node]]
+            label = self.ax.text(x, y, str(node), ha='center', va='center',
+                                 fontsize=11, color='white', fontweight='bold', zorder=3)
+            self.node_labels[node] = label
+        return label
+
+    def _patch_detail_artists(self, moved_nodes, moved_edge_rows):
+        for edge in [edge for edge in self.edge_arrows if edge not in self.edge_rows]:
+            self.edge_arrows.pop(edge).remove()
+            self.shown_edges.discard(edge)
+        for node in [node for node in self.node_labels if node not in self.node_rows]:
+            self.node_labels.pop(node).remove()
+            self.shown_labels.discard(node)
+        for row in moved_edge_rows:
+            arrow = self.edge_arrows.get(self.edge_list[row])
+            if arrow is not None:
+                arrow.set_positions(self.node_xy[self.edge_src[row]], self.node_xy[self.edge_dst[row]])
+        for node in moved_nodes:
+            label = self.node_labels.get(node)
+            if label is not None:
+                label.set_position(self.node_xy[self.node_rows[node]])
+
+    def _make_arrow(self, pos_s, pos_t, color, linewidth):
+        return mpatches.FancyArrowPatch(
+            posA=pos_s, posB=pos_t, 
+            connectionstyle=f"arc3,rad=0.1",
+            color=color, 
+            linewidth=linewidth, 
+            arrowstyle='-|>',
+            mutation_scale=30,
+            shrinkA=30,
+            shrinkB=30,
+            alpha=0.8
+        )
+
+    def _sample_edge_arcs(self, pos_s, pos_t, rad=0.1, samples=12, t_range=(0.15, 0.85)):
+        if not len(pos_s):
+            return np.empty((0, samples, 2))
+        # arc3 строится в координатах экрана, поэтому и точки считаем там же
+        p1 = self.ax.transData.transform(pos_s)
+        p2 = self.ax.transData.transform(pos_t)
+        delta = p2 - p1
+        control = (p1 + p2) / 2 + rad * np.column_stack((delta[:, 1], -delta[:, 0]))
+        t = np.linspace(*t_range, samples)[None, :, None]
+        points = (1 - t) ** 2 * p1[:, None] + 2 * (1 - t) * t * control[:, None] + t ** 2 * p2[:, None]
+        return self.ax.transData.inverted().transform(points.reshape(-1, 2)).reshape(len(pos_s), samples, 2)
+
+    def _rebuild_hit_index(self):
+        self.node_index.build(self.node_xy)
+        samples = self.edge_samples.shape[1]
+        self.edge_index.build(self.edge_samples.reshape(-1, 2), np.repeat(np.arange(len(self.edge_list)), samples))
+
+    def _update_hover_artist(self):
+        if self.hover_artist is None: return
+        row = self.edge_rows.get(self.hovered_edge, -1)
+        if row >= 0:
+            self.hover_artist.set_positions(self.node_xy[self.edge_src[row]], self.node_xy[self.edge_dst[row]])
+            self.hover_artist.set_visible(True)
+        else:
+            self.hover_artist.set_visible(False)
+
+    def _update_selection_artist(self):
+        if self.selection_artist is None: return
+        row = self.node_rows.get(self.selected_node, -1)
+        if row >= 0:
+            self.selection_artist.set_offsets(self.node_xy[row:row + 1])
+            self.selection_artist.set_visible(True)
+        else:
+            self.selection_artist.set_visible(False)
 
     def on_hover(self, event):
-        if not event.inaxes or not self.node_positions or not self.G.edges():
+        if self.press is not None:
+            self._pan(event); return
+        if not event.inaxes or not self.node_ids or not self.edge_list:
             if self.hovered_edge:
-                self.hovered_edge = None; self.redraw_graph(); QToolTip.hideText()
+                self.hovered_edge = None; self._update_hover_artist(); self._blit_overlays(); QToolTip.hideText()
             return
 
-        x, y = event.xdata, event.ydata
-        hovered_edge = None
-        min_distance_sq = float('inf')
-
-        for edge in self.G.edges():
-            u, v = edge
-            pos_u = self.node_positions[u]
-            pos_v = self.node_positions[v]
-            mid_point = ((pos_u[0] + pos_v[0]) / 2, (pos_u[1] + pos_v[1]) / 2)
-            dist_sq = (mid_point[0] - x)**2 + (mid_point[1] - y)**2
-
-            if dist_sq < 0.1 and dist_sq < min_distance_sq:
-                min_distance_sq = dist_sq
-                hovered_edge = edge
+        row = self.edge_index.nearest(event.xdata, event.ydata, EDGE_HIT_RADIUS)
+        hovered_edge = self.edge_list[row] if row >= 0 else None
 
         if hovered_edge != self.hovered_edge:
             self.hovered_edge = hovered_edge
-            self.redraw_graph()
+            self._update_hover_artist()
+            self._blit_overlays()
 
             if hovered_edge:
-                QToolTip.showText(QCursor.pos(), self.edge_labels.get(hovered_edge, ""), self)
+                QToolTip.showText(QCursor.pos(), self.story.edge_label(*hovered_edge) or "", self)
             else:
                 QToolTip.hideText()
 
     def on_click(self, event):
-        if not event.inaxes or not self.node_positions: return
+        if not event.inaxes or not self.node_ids: return
 
-        clicked_node = None
-        min_dist_sq = float('inf')
-        x, y = event.xdata, event.ydata
-
-        for node, pos in self.node_positions.items():
-            dist_sq = (pos[0] - x)**2 + (pos[1] - y)**2
-            if dist_sq < min_dist_sq:
-                min_dist_sq = dist_sq
-                clicked_node = node
+        row = self.node_index.nearest(event.xdata, event.ydata, NODE_HIT_RADIUS)
+        clicked_node = self.node_ids[row] if row >= 0 else None
 
-        if min_dist_sq < 0.5:
+        if clicked_node is not None:
             if self.selected_node == clicked_node:
-                scene = next((s for s in self.story_data['scenes'] if s['scene_id'] == clicked_node), None)
-                if scene:
+                index = self.story.index_of(clicked_node)
+                if index >= 0:
+                    scene = self.story.scene(index)
                     dialog = SceneDetailDialog(scene, parent=self)
                     dialog.exec_()
+                    if dialog.regenerate is not None:
+                        self.regenerateRequested.emit(clicked_node, dialog.regenerate)
             else:
                 self.selected_node = clicked_node
         else:
             self.selected_node = None
 
-        self.redraw_graph()
+        self._update_selection_artist()
+        self._blit_overlays()
+
+    def _recolor_nodes(self):
+        self.node_colors = np.full(len(self.node_ids), '#4dabf7', dtype=object)
+        self.node_colors[[self.node_rows[n] for n in self.analysis.endings if n in self.node_rows]] = '#ff6b6b'
+        start_node = self.story.get('start_scene')
+        if start_node in self.node_rows:
+            self.node_colors[self.node_rows[start_node]] = '#51cf66'
+
+    def _scene_index(self, scene_id) -> int:
+        index = self.story.index_of(scene_id)
+        if index < 0:
+            raise ValueError(f"Сцена {scene_id} не найдена.")
+        return index
+
+    def add_scene(self, scene_id, text='', choices=(), is_ending=None):
+        scene_id = str(scene_id)
+        if self.story.index_of(scene_id) >= 0:
+            raise ValueError(f"Сцена {scene_id} уже существует.")
+        self.story.append_scene(scene_id, text, [(c.get('text', '...'), c.get('next_scene')) for c in choices],
+                                is_ending)
+        self._apply_edit(changed=[scene_id])
+
+    def remove_scene(self, scene_id):
+        scene_id = str(scene_id)
+        self.story.remove_scene(self._scene_index(scene_id))
+        self._apply_edit(changed=[], removed=[scene_id])
+
+    def update_scene(self, scene_id, text=None, choices=None, is_ending=None):
+        scene_id = str(scene_id)
+        index = self._scene_index(scene_id)
+        if text is not None:
+            self.story.set_text(index, text)
+        if is_ending is not None:
+            self.story.set_ending(index, is_ending)
+        if choices is None:
+            # текст сцены на графе не виден: перерисовывать нечего
+            self.storyEdited.emit()
+            return
+        self.story.set_choices(index, [(c.get('text', '...'), c.get('next_scene')) for c in choices])
+        self._apply_edit(changed=[scene_id])
+
+    def replace_scenes(self, scenes):
+        # пачка правок (например, перегенерированная ветка) применяется одним обновлением графа
+        changed = []
+        for scene in scenes:
+            scene_id = str(scene['scene_id'])
+            choices = [(c.get('text', '...'), c.get('next_scene')) for c in scene.get('choices', [])]
+            index = self.story.index_of(scene_id)
+            if index < 0:
+                self.story.append_scene(scene_id, scene.get('text'), choices, scene.get('is_ending'))
+            else:
+                self.story.set_text(index, scene.get('text'))
+                self.story.set_choices(index, choices)
+                self.story.set_ending(index, scene.get('is_ending'))
+            changed.append(scene_id)
+        self._apply_edit(changed=changed)
+
+    def add_choice(self, scene_id, text, next_scene):
+        index = self._scene_index(str(scene_id))
+        choices = [{'text': t, 'next_scene': n} for t, n in self.story.choices(index)]
+        self.update_scene(scene_id, choices=choices + [{'text': text, 'next_scene': str(next_scene)}])
+
+    def remove_choice(self, scene_id, next_scene):
+        index = self._scene_index(str(scene_id))
+        choices = [{'text': t, 'next_scene': n} for t, n in self.story.choices(index) if n != str(next_scene)]
+        self.update_scene(scene_id, choices=choices)
+
+    def _apply_edit(self, changed, removed=()):
+        old_analysis = self.analysis
+        changed = [node for node in dict.fromkeys(changed) if self.story.index_of(node) >= 0]
+
+        for node in removed:
+            if node in self.G:
+                self.G.remove_node(node)
+        for node in changed:
+            self.G.add_node(node)
+            targets = {self.story.scene_id(t) for t in self.story.successors(self.story.index_of(node))}
+            self.G.remove_edges_from([(node, t) for t in list(self.G.successors(node)) if t not in targets])
+            self.G.add_edges_from((node, t) for t in targets)
+        # добавленная сцена могла починить битые ссылки других сцен;
+        # рёбра изменённых сцен уже взяты из их текущих выборов
+        resolved = [(source, target) for source, _, target in (old_analysis.dangling if old_analysis else [])
+                    if target in changed and source in self.G and source not in changed]
+        self.G.add_edges_from(resolved)
+
+        with metrics.span('story.analyze', scenes=len(self.story)):
+            self.analysis = StoryAnalysis(self.story)
+
+        if not len(self.story):
+            self.draw_empty_graph("В сгенерированной истории нет сцен.")
+        elif self.node_collection is None or old_analysis is None:
+            self.redraw_graph()
+        else:
+            with metrics.span('graph.patch', changed=len(changed), removed=len(removed)):
+                self._patch_graph(old_analysis, changed, removed, resolved)
+            # стрелки и подписи затронутых сцен уже обновлены, здесь только показываются новые в кадре
+            self._update_level_of_detail(force=True)
+            self._update_hover_artist()
+            self._update_selection_artist()
+            self.draw_idle()
+        self.storyEdited.emit()
+
+    def _patch_graph(self, old_analysis, changed, removed, resolved):
+        removed = [node for node in removed if node in self.node_rows]
+        if self.selected_node in removed:
+            self.selected_node = None
+        self.hovered_edge = None
+
+        # 1. строки удалённых сцен и их рёбер
+        if removed:
+            keep = np.ones(len(self.node_ids), dtype=bool)
+            keep[[self.node_rows[node] for node in removed]] = False
+            remap = np.cumsum(keep) - 1
+            self._drop_edges(~(keep[self.edge_src] & keep[self.edge_dst]))
+            self.edge_src, self.edge_dst = remap[self.edge_src], remap[self.edge_dst]
+            self.node_ids = [node for node, kept in zip(self.node_ids, keep) if kept]
+            self.node_rows = {node: row for row, node in enumerate(self.node_ids)}
+            self.node_xy = self.node_xy[keep]
+        else:
+            # список и массив раскладки лежат в кэше: правки не должны менять закэшированную запись
+            self.node_ids = list(self.node_ids)
+            self.node_xy = self.node_xy.copy()
+
+        added = [node for node in changed if node not in self.node_rows]
+        for node in added:
+            self.node_rows[node] = len(self.node_ids)
+            self.node_ids.append(node)
+        if added:
+            self.node_xy = np.vstack([self.node_xy, np.zeros((len(added), 2))])
+
+        # 2. раскладка пересчитывается только на уровнях, где изменился состав сцен
+        old_levels, new_levels = old_analysis.levels, self.analysis.levels
+        touched = set(changed) | set(removed)
+        touched.update(node for node, level in new_levels.items() if old_levels.get(node) != level)
+        touched.update(node for node in old_levels if node not in new_levels)
+        affected_levels = {levels[node] for levels in (old_levels, new_levels) for node in touched if node in levels}
+
+        moved = set(added)
+        if affected_levels:
+            members = {level: [] for level in affected_levels}
+            for node, level in new_levels.items():
+                if level in members:
+                    members[level].append(node)
+            for level, nodes in members.items():
+                nodes.sort()
+                rows = [self.node_rows[node] for node in nodes]
+                self.node_xy[rows] = level_positions(len(rows), level)
+                moved.update(nodes)
+
+        unreachable = self.analysis.unreachable
+        max_level = max(new_levels.values(), default=-1)
+        if unreachable and (set(unreachable) != set(old_analysis.unreachable) or touched & set(unreachable) or
+                            max_level != max(old_levels.values(), default=-1)):
+            rows = [self.node_rows[node] for node in unreachable]
+            self.node_xy[rows] = unreachable_positions(self.G, unreachable, max_level)
+            moved.update(unreachable)
+
+        # 3. рёбра: исходящие из изменённых сцен заменяются, у сдвинутых сцен пересчитываются дуги
+        changed_rows = np.array([self.node_rows[node] for node in changed], dtype=np.int64)
+        self._drop_edges(np.isin(self.edge_src, changed_rows))
+        first_new = len(self.edge_list)
+        new_edges = list(dict.fromkeys([(node, t) for node in changed for t in self.G.successors(node)] + resolved))
+        new_edges = [edge for edge in new_edges if edge not in self.edge_rows]
+        for edge in new_edges:
+            self.edge_rows[edge] = len(self.edge_list)
+            self.edge_list.append(edge)
+        self.edge_src = np.concatenate([self.edge_src, [self.node_rows[s] for s, _ in new_edges]]).astype(np.int64)
+        self.edge_dst = np.concatenate([self.edge_dst, [self.node_rows[t] for _, t in new_edges]]).astype(np.int64)
+
+        moved_rows = np.array([self.node_rows[node] for node in moved], dtype=np.int64)
+        stale = np.isin(self.edge_src, moved_rows) | np.isin(self.edge_dst, moved_rows)
+        stale[first_new:] = True
+        self.edge_samples = np.concatenate([self.edge_samples,
+                                            np.zeros((len(new_edges),) + self.edge_samples.shape[1:])])
+        self.edge_arcs = np.concatenate([self.edge_arcs, np.zeros((len(new_edges),) + self.edge_arcs.shape[1:])])
+        if stale.any():
+            pos_s, pos_t = self.node_xy[self.edge_src[stale]], self.node_xy[self.edge_dst[stale]]
+            self.edge_samples[stale] = self._sample_edge_arcs(pos_s, pos_t)
+            self.edge_arcs[stale] = self._sample_edge_arcs(pos_s, pos_t, samples=16, t_range=(0.0, 1.0))
+
+        self._recolor_nodes()
+        self._rebuild_hit_index()
+        self._patch_detail_artists(moved, np.flatnonzero(stale))
+
+    def _drop_edges(self, mask):
+        if not mask.any():
+            return
+        keep = ~mask
+        self.edge_list = [edge for edge, kept in zip(self.edge_list, keep) if kept]
+        self.edge_rows = {edge: row for row, edge in enumerate(self.edge_list)}
+        self.edge_src, self.edge_dst = self.edge_src[keep], self.edge_dst[keep]
+        self.edge_samples, self.edge_arcs = self.edge_samples[keep], self.edge_arcs[keep]
 
     def get_graph_statistics(self):
         if not self.G.nodes(): return "Статистика недоступна."
-        num_endings = len([n for n, d in self.G.out_degree() if d == 0])
-        return f"Сцен: {self.G.number_of_nodes()} | Концовок: {num_endings} | Переходов: {self.G.number_of_edges()}"
\ No newline at end of file
+        analysis = self.analysis
+        stats = f"Сцен: {self.G.number_of_nodes()} | Концовок: {len(analysis.endings)} | Переходов: {self.G.number_of_edges()}"
+        if analysis.unreachable:
+            stats += f" | Недостижимых: {len(analysis.unreachable)}"
+        if analysis.dangling:
+            stats += f" | Битых ссылок: {len(analysis.dangling)}"
+        if analysis.cycles:
+            stats += f" | Циклов: {len(analysis.cycles)}"
+        return stats
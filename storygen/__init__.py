@@ -0,0 +1,38 @@
+from StoryObject import StoryObject
+from storygen.analysis import StoryAnalysis, analyze_story
+from storygen.compact import CompactStory, StringTable
+from storygen.library import StoryLibrary
+from storygen.convert import convert_ai_array_to_compact, convert_ai_array_to_graph_format
+from storygen.parsing import (SceneStreamParser, TolerantJSONParser, clean_json_response, parse_scene_array,
+                              parse_scenes_with_fragments)
+from storygen.prompt import (build_act_outline_prompt, build_acts_prompt, build_expand_prompt, build_outline_prompt,
+                             build_prompt, build_regenerate_prompt, build_repair_prompt)
+from storygen.regenerate import RegenerationContext
+from storygen.storage import StoryArchive, load_story, save_story
+
+__all__ = [
+    'CompactStory',
+    'RegenerationContext',
+    'StoryAnalysis',
+    'StoryArchive',
+    'StoryLibrary',
+    'StoryObject',
+    'analyze_story',
+    'SceneStreamParser',
+    'StringTable',
+    'TolerantJSONParser',
+    'build_act_outline_prompt',
+    'build_acts_prompt',
+    'build_expand_prompt',
+    'build_outline_prompt',
+    'build_prompt',
+    'build_regenerate_prompt',
+    'build_repair_prompt',
+    'clean_json_response',
+    'convert_ai_array_to_compact',
+    'convert_ai_array_to_graph_format',
+    'load_story',
+    'parse_scene_array',
+    'parse_scenes_with_fragments',
+    'save_story',
+]
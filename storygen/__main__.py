@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import json
+import sys
+
+import settings
+from StoryObject import StoryObject
+from storygen.storage import STORY_EXTENSION, load_story, save_story
+
+
+def cmd_generate(args):
+    import ai
+
+    story_object = StoryObject(args.description, args.genre, args.heroes, args.mood)
+    error_msg = story_object.validate()
+    if error_msg:
+        print(error_msg, file=sys.stderr)
+        return 2
+
+    if args.scenes:
+        story = asyncio.run(ai.get_large_story_from_ai(story_object, args.scenes, use_cache=not args.no_cache))
+    else:
+        story = asyncio.run(ai.get_story_from_ai(story_object, use_cache=not args.no_cache))
+    if args.output and args.output.endswith(STORY_EXTENSION):
+        save_story(story, args.output)
+        return 0
+    text = json.dumps(story, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+def cmd_analyze(args):
+    from storygen.analysis import analyze_story
+
+    invalid = 0
+    for path in args.files:
+        analysis = analyze_story(load_story(path))
+        if not analysis.is_valid:
+            invalid += 1
+        if not args.quiet or not analysis.is_valid:
+            print(f"{path}:\n{analysis.summary()}\n")
+    print(f"Проверено: {len(args.files)}, с проблемами: {invalid}")
+    return 1 if invalid else 0
+
+
+def cmd_library(args):
+    from datetime import datetime
+    from storygen.library import StoryLibrary
+
+    library = StoryLibrary(args.db) if args.db else StoryLibrary()
+    try:
+        if args.action == 'list':
+            for row in library.stories(args.limit):
+                created = datetime.fromtimestamp(row['created_at']).strftime('%Y-%m-%d %H:%M')
+                print(f"{row['id']}\t{created}\t{row['scene_count']} сцен\t{row['title'] or 'Без названия'}")
+        elif args.action == 'search':
+            for row in library.search(" ".join(args.query), args.limit):
+                print(f"{row['story_id']}\t{row['scene_id'] or '-'}\t{row['title'] or 'Без названия'}: {row['snippet']}")
+        elif args.action == 'add':
+            for path in args.files:
+                print(f"{path}: {library.add(load_story(path))}")
+        elif args.action == 'export':
+            story = library.get(args.id)
+            if story is None:
+                print(f"История {args.id} не найдена.", file=sys.stderr)
+                return 1
+            if args.output.endswith(STORY_EXTENSION):
+                save_story(story, args.output)
+            else:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    json.dump(story.to_dict(), f, ensure_ascii=False, indent=2)
+        elif args.action == 'delete':
+            if not library.delete(args.id):
+                print(f"История {args.id} не найдена.", file=sys.stderr)
+                return 1
+    finally:
+        library.close()
+    return 0
+
+
+def cmd_metrics(args):
+    import metrics
+
+    summary = metrics.summarize(metrics.read_events(args.file))
+    for name, stats in sorted(summary['spans'].items()):
+        print(f"{name}: {stats['count']} шт., p50 {stats['p50_ms']:.1f} мс, "
+              f"p95 {stats['p95_ms']:.1f} мс, макс. {stats['max_ms']:.1f} мс")
+    for name, value in sorted(summary['counters'].items()):
+        print(f"{name}: {value}")
+    return 0
+
+
+def cmd_batch(argv):
+    import batch
+    return batch.main(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # batch разбирает аргументы сам, включая --help
+    if argv[:1] == ['batch']:
+        return cmd_batch(argv[1:])
+
+    parser = argparse.ArgumentParser(prog='python -m storygen',
+                                     description="Генерация историй без графического интерфейса.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help="сгенерировать одну историю")
+    generate.add_argument('-d', '--description', required=True, help="описание истории")
+    generate.add_argument('-g', '--genre', default='RPG', help="жанр")
+    generate.add_argument('--heroes', required=True, help="персонажи через точку с запятой")
+    generate.add_argument('-m', '--mood', default=settings.MOODS['default'],
+                          choices=[m['value'] for m in settings.MOODS['options']], help="настроение")
+    generate.add_argument('-n', '--scenes', type=int,
+                          help="число сцен для большого квеста (план + параллельное написание сцен)")
+    generate.add_argument('-o', '--output', help="файл для сохранения: .json или архив .gsg (по умолчанию stdout)")
+    generate.add_argument('--no-cache', action='store_true', help="не использовать кэш ответов AI")
+    generate.set_defaults(func=cmd_generate)
+
+    analyze = subparsers.add_parser('analyze', help="проверить структуру сохранённых историй")
+    analyze.add_argument('files', nargs='+', help="файлы историй (.json или .gsg)")
+    analyze.add_argument('-q', '--quiet', action='store_true', help="выводить только истории с проблемами")
+    analyze.set_defaults(func=cmd_analyze)
+
+    library = subparsers.add_parser('library', help="библиотека сохранённых историй")
+    library.add_argument('--db', help="файл библиотеки (по умолчанию settings.LIBRARY_PATH)")
+    library_actions = library.add_subparsers(dest='action', required=True)
+    library_list = library_actions.add_parser('list', help="последние истории")
+    library_list.add_argument('-n', '--limit', type=int, default=50)
+    library_search = library_actions.add_parser('search', help="полнотекстовый поиск по сценам")
+    library_search.add_argument('query', nargs='+')
+    library_search.add_argument('-n', '--limit', type=int, default=50)
+    library_add = library_actions.add_parser('add', help="добавить истории из файлов (.json или .gsg)")
+    library_add.add_argument('files', nargs='+')
+    library_export = library_actions.add_parser('export', help="сохранить историю из библиотеки в файл")
+    library_export.add_argument('id', type=int)
+    library_export.add_argument('-o', '--output', required=True, help="файл .json или .gsg")
+    library_delete = library_actions.add_parser('delete', help="удалить историю")
+    library_delete.add_argument('id', type=int)
+    library.set_defaults(func=cmd_library)
+
+    metrics_parser = subparsers.add_parser('metrics', help="сводка по файлу метрик (GSG_METRICS_FILE)")
+    metrics_parser.add_argument('file', help="JSONL-файл с метриками")
+    metrics_parser.set_defaults(func=cmd_metrics)
+
+    subparsers.add_parser('batch', help="пакетная генерация (см. python -m storygen batch --help)")
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import hashlib
+import json
+
+import settings
+from cache import LRUCache
+from storygen.compact import CompactStory
+
+_analysis_cache = LRUCache(settings.ANALYSIS_CACHE_SIZE)
+
+
+def _scene_items(story) -> list[tuple]:
+    if isinstance(story, CompactStory):
+        return list(story.iter_scenes())
+    return [(scene['scene_id'], [(c.get('text', '...'), c.get('next_scene')) for c in scene.get('choices', [])])
+            for scene in story.get('scenes', [])]
+
+
+class StoryAnalysis:
+    def __init__(self, story, scene_items: list[tuple] = None):
+        scene_items = _scene_items(story) if scene_items is None else scene_items
+        self.start_scene = story.get('start_scene')
+        self.scene_ids = [scene_id for scene_id, _ in scene_items]
+
+        known = set(self.scene_ids)
+        self.successors = {scene_id: [] for scene_id in self.scene_ids}
+        self.dangling = []
+        for scene_id, choices in scene_items:
+            targets = self.successors[scene_id]
+            for choice_text, next_scene in choices:
+                if next_scene in known:
+                    if next_scene not in targets:
+                        targets.append(next_scene)
+                else:
+                    self.dangling.append((scene_id, choice_text, next_scene))
+        for targets in self.successors.values():
+            targets.sort()
+
+        self.endings = [scene_id for scene_id in self.scene_ids if not self.successors[scene_id]]
+        self.levels = self._bfs_levels()
+        self.reachable = set(self.levels)
+        self.unreachable = [scene_id for scene_id in self.scene_ids if scene_id not in self.reachable]
+        self.cycles = self._find_cycles()
+        self.shortest_path_to_ending = {e: self.levels[e] for e in self.endings if e in self.levels}
+        self.longest_path_to_ending = self._longest_paths_to_endings()
+
+        branching = [len(self.successors[s]) for s in self.reachable if self.successors[s]]
+        self.branching_factor = sum(branching) / len(branching) if branching else 0.0
+        self.max_branching = max(branching, default=0)
+
+    def _bfs_levels(self) -> dict:
+        if self.start_scene not in self.successors:
+            return {}
+        levels = {self.start_scene: 0}
+        queue = [self.start_scene]; head = 0
+        while head < len(queue):
+            u = queue[head]; head += 1
+            for v in self.successors[u]:
+                if v not in levels:
+                    levels[v] = levels[u] + 1
+                    queue.append(v)
+        return levels
+
+    def _find_cycles(self) -> list:
+        # итеративный алгоритм Тарьяна: рекурсия не упирается в лимит на больших квестах
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        cycles = []
+        counter = 0
+
+        for root in self.scene_ids:
+            if root in index:
+                continue
+            work = [(root, iter(self.successors[root]))]
+            index[root] = lowlink[root] = counter; counter += 1
+            stack.append(root); on_stack.add(root)
+            while work:
+                node, successors = work[-1]
+                advanced = False
+                for succ in successors:
+                    if succ not in index:
+                        index[succ] = lowlink[succ] = counter; counter += 1
+                        stack.append(succ); on_stack.add(succ)
+                        work.append((succ, iter(self.successors[succ])))
+                        advanced = True
+                        break
+                    if succ in on_stack:
+                        lowlink[node] = min(lowlink[node], index[succ])
+                if advanced:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop(); on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in self.successors[node]:
+                        cycles.append(sorted(component))
+        return cycles
+
+    def _longest_paths_to_endings(self) -> dict:
+        # самый длинный путь без повторного прохода по циклам: обратные рёбра DFS отбрасываются
+        if self.start_scene not in self.successors:
+            return {}
+        order = []
+        state = {self.start_scene: 1}
+        dag = {}
+        work = [(self.start_scene, iter(self.successors[self.start_scene]))]
+        dag[self.start_scene] = []
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if state.get(succ) == 1:
+                    continue
+                dag[node].append(succ)
+                if succ not in state:
+                    state[succ] = 1
+                    dag[succ] = []
+                    work.append((succ, iter(self.successors[succ])))
+                    break
+            else:
+                work.pop()
+                state[node] = 2
+                order.append(node)
+
+        distance = {self.start_scene: 0}
+        for node in reversed(order):
+            if node not in distance:
+                continue
+            for succ in dag[node]:
+                if distance.get(succ, -1) < distance[node] + 1:
+                    distance[succ] = distance[node] + 1
+        return {e: distance[e] for e in self.endings if e in distance}
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.unreachable and not self.dangling and bool(self.shortest_path_to_ending)
+
+    def summary(self) -> str:
+        lines = [
+            f"Сцен: {len(self.scene_ids)} | Концовок: {len(self.endings)} | "
+            f"Ветвление: {self.branching_factor:.2f} (макс. {self.max_branching})"
+        ]
+        if self.unreachable:
+            lines.append(f"Недостижимые сцены: {', '.join(self.unreachable)}")
+        if self.dangling:
+            lines.append("Ссылки на несуществующие сцены: " +
+                         ", ".join(f"{src} → {target!r}" for src, _, target in self.dangling))
+        if self.cycles:
+            lines.append("Циклы: " + "; ".join(" → ".join(cycle) for cycle in self.cycles))
+        if self.shortest_path_to_ending:
+            lines.append("Пути до концовок (мин./макс.): " + ", ".join(
+                f"{e}: {self.shortest_path_to_ending[e]}/{self.longest_path_to_ending.get(e, '?')}"
+                for e in self.shortest_path_to_ending))
+        else:
+            lines.append("Ни одна концовка не достижима из начальной сцены.")
+        return "\n".join(lines)
+
+
+def story_structure_key(story, scene_items: list[tuple] = None) -> str:
+    # в ключ входят порядок сцен и тексты выборов: они попадают в endings, unreachable и dangling
+    scene_items = _scene_items(story) if scene_items is None else scene_items
+    payload = json.dumps([story.get('start_scene'), scene_items], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def analyze_story(story) -> StoryAnalysis:
+    scene_items = _scene_items(story)
+    key = story_structure_key(story, scene_items)
+    analysis = _analysis_cache.get(key)
+    if analysis is None:
+        analysis = StoryAnalysis(story, scene_items)
+        _analysis_cache.put(key, analysis)
+    return analysis
@@ -0,0 +1,203 @@
+from array import array
+
+
+class StringTable:
+    __slots__ = ('strings', '_index')
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def intern(self, value) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        index = self._index.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._index[value] = index
+        return index
+
+    def get(self, index: int):
+        return self.strings[index] if index >= 0 else None
+
+    def __len__(self):
+        return len(self.strings)
+
+
+def lazy_text_ref(n: int) -> int:
+    return -n - 2
+
+
+class CompactStory:
+    __slots__ = ('strings', 'title', 'description', 'start_scene', 'scene_ids', 'texts', 'endings',
+                 'choice_offsets', 'choice_texts', 'choice_target_ids', 'choice_targets', 'text_source', '_index')
+
+    def __init__(self, strings: StringTable = None):
+        self.strings = strings if strings is not None else StringTable()
+        self.title = self.description = self.start_scene = -1
+        self.scene_ids = array('i')
+        # texts[i]: -1 - текста нет, >= 0 - id в таблице строк, <= -2 - текст lazy_text_ref(n) из text_source
+        self.texts = array('i')
+        self.endings = array('b')
+        # CSR: выборы сцены i лежат в диапазоне choice_offsets[i]:choice_offsets[i + 1]
+        self.choice_offsets = array('i', [0])
+        self.choice_texts = array('i')
+        self.choice_target_ids = array('i')
+        self.choice_targets = array('i')
+        self.text_source = None
+        self._index = None
+
+    @classmethod
+    def from_dict(cls, story_data: dict, strings: StringTable = None) -> 'CompactStory':
+        story = cls(strings)
+        intern = story.strings.intern
+        story.title = intern(story_data.get('title'))
+        story.description = intern(story_data.get('description'))
+        story.start_scene = intern(story_data.get('start_scene'))
+        for scene in story_data.get('scenes', []):
+            story.add_scene(scene['scene_id'], scene.get('text'),
+                            [(c.get('text'), c.get('next_scene')) for c in scene.get('choices', [])],
+                            scene.get('is_ending'))
+        story.resolve_targets()
+        return story
+
+    def add_scene(self, scene_id, text, choices, is_ending=None):
+        intern = self.strings.intern
+        string_id = intern(scene_id)
+        self.scene_ids.append(string_id)
+        self.texts.append(intern(text))
+        self.endings.append(-1 if is_ending is None else int(bool(is_ending)))
+        for choice_text, next_scene in choices:
+            self.choice_texts.append(intern(choice_text))
+            self.choice_target_ids.append(intern(next_scene))
+        self.choice_offsets.append(len(self.choice_texts))
+        if self._index is not None:
+            self._index[string_id] = len(self.scene_ids) - 1
+
+    def append_scene(self, scene_id, text, choices, is_ending=None) -> int:
+        # в отличие от add_scene, сразу связывает выборы: для правок уже построенной истории
+        referenced = str(scene_id) in self.strings._index
+        self.add_scene(scene_id, text, choices, is_ending)
+        i = len(self.scene_ids) - 1
+        index = self.index
+        start = self.choice_offsets[i]
+        self.choice_targets.extend(index.get(t, -1) for t in self.choice_target_ids[start:])
+        if referenced:
+            string_id = self.scene_ids[i]
+            for k, target_id in enumerate(self.choice_target_ids):
+                if target_id == string_id and self.choice_targets[k] < 0:
+                    self.choice_targets[k] = i
+        return i
+
+    def set_text(self, i: int, text):
+        self.texts[i] = self.strings.intern(text)
+
+    def set_ending(self, i: int, is_ending):
+        self.endings[i] = -1 if is_ending is None else int(bool(is_ending))
+
+    def set_choices(self, i: int, choices):
+        intern = self.strings.intern
+        index = self.index
+        start, end = self.choice_offsets[i], self.choice_offsets[i + 1]
+        target_ids = array('i', (intern(next_scene) for _, next_scene in choices))
+        self.choice_texts[start:end] = array('i', (intern(choice_text) for choice_text, _ in choices))
+        self.choice_target_ids[start:end] = target_ids
+        self.choice_targets[start:end] = array('i', (index.get(t, -1) for t in target_ids))
+        delta = len(target_ids) - (end - start)
+        if delta:
+            self.choice_offsets[i + 1:] = array('i', map(delta.__add__, self.choice_offsets[i + 1:]))
+
+    def remove_scene(self, i: int):
+        start, end = self.choice_offsets[i], self.choice_offsets[i + 1]
+        for values in (self.choice_texts, self.choice_target_ids, self.choice_targets):
+            del values[start:end]
+        del self.choice_offsets[i + 1]
+        self.choice_offsets[i + 1:] = array('i', map((start - end).__add__, self.choice_offsets[i + 1:]))
+        del self.scene_ids[i], self.texts[i], self.endings[i]
+        # выборы, ведущие в удалённую сцену, становятся битыми ссылками
+        self.choice_targets = array('i', (t - 1 if t > i else -1 if t == i else t for t in self.choice_targets))
+        self._index = None
+
+    def resolve_targets(self):
+        index = self.index
+        self.choice_targets = array('i', (index.get(t, -1) for t in self.choice_target_ids))
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            self._index = {sid: i for i, sid in enumerate(self.scene_ids)}
+        return self._index
+
+    def __len__(self):
+        return len(self.scene_ids)
+
+    def index_of(self, scene_id) -> int:
+        string_id = self.strings._index.get(str(scene_id), -1)
+        return self.index.get(string_id, -1)
+
+    def scene_id(self, i: int) -> str:
+        return self.strings.get(self.scene_ids[i])
+
+    def text(self, i: int):
+        ref = self.texts[i]
+        if ref <= -2:
+            return self.text_source.load(-ref - 2)
+        return self.strings.get(ref)
+
+    def choices(self, i: int) -> list[tuple]:
+        get = self.strings.get
+        return [(get(self.choice_texts[k]), get(self.choice_target_ids[k]))
+                for k in range(self.choice_offsets[i], self.choice_offsets[i + 1])]
+
+    def successors(self, i: int) -> list[int]:
+        return [t for t in self.choice_targets[self.choice_offsets[i]:self.choice_offsets[i + 1]] if t >= 0]
+
+    def edges(self):
+        get = self.strings.get
+        for i in range(len(self.scene_ids)):
+            for k in range(self.choice_offsets[i], self.choice_offsets[i + 1]):
+                target = self.choice_targets[k]
+                if target >= 0:
+                    yield i, target, get(self.choice_texts[k])
+
+    def edge_label(self, source_id, target_id):
+        source, target = self.index_of(source_id), self.index_of(target_id)
+        if source < 0 or target < 0:
+            return None
+        for k in range(self.choice_offsets[source], self.choice_offsets[source + 1]):
+            if self.choice_targets[k] == target:
+                return self.strings.get(self.choice_texts[k])
+        return None
+
+    def iter_scenes(self):
+        for i in range(len(self.scene_ids)):
+            yield self.scene_id(i), self.choices(i)
+
+    def scene(self, i: int) -> dict:
+        scene = {'scene_id': self.scene_id(i)}
+        if self.texts[i] != -1:
+            scene['text'] = self.text(i)
+        scene['choices'] = [{'text': text, 'next_scene': next_scene} for text, next_scene in self.choices(i)]
+        if self.endings[i] >= 0:
+            scene['is_ending'] = bool(self.endings[i])
+        return scene
+
+    def get(self, key, default=None):
+        value = {'title': self.title, 'description': self.description, 'start_scene': self.start_scene}.get(key, -1)
+        return self.strings.get(value) if value >= 0 else default
+
+    def to_dict(self) -> dict:
+        story_data = {}
+        for key in ('title', 'description', 'start_scene'):
+            value = self.get(key)
+            if value is not None:
+                story_data[key] = value
+        story_data['scenes'] = [self.scene(i) for i in range(len(self.scene_ids))]
+        return story_data
+
+    def nbytes(self) -> int:
+        arrays = (self.scene_ids, self.texts, self.endings, self.choice_offsets,
+                  self.choice_texts, self.choice_target_ids, self.choice_targets)
+        return sum(a.itemsize * len(a) for a in arrays)
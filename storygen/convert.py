@@ -0,0 +1,40 @@
+from StoryObject import StoryObject
+from storygen.compact import CompactStory, StringTable
+
+
+def convert_ai_array_to_compact(scene_list: list[dict], story_object: StoryObject,
+                                strings: StringTable = None) -> CompactStory:
+    if not scene_list:
+        raise ValueError("AI вернул пустой список сцен.")
+        
+    scene_id_to_id = {}
+    for i, scene_data in enumerate(scene_list):
+        scene_id_to_id[scene_data.get('scene_id', str(i+1))] = str(i+1)
+    
+    title_text = story_object.description[:50]
+    if len(story_object.description) > 50:
+        title_text += "..."
+
+    story = CompactStory(strings)
+    story.title = story.strings.intern(title_text)
+    story.description = story.strings.intern(story_object.description)
+    story.start_scene = story.strings.intern(scene_id_to_id.get("1", "1"))
+
+    for i, scene_data in enumerate(scene_list):
+        choices = []
+        for c in scene_data.get('choices', []):
+            next_scene = c.get('next_scene', '')
+            choices.append((c.get('text', '...'), scene_id_to_id.get(next_scene, next_scene)))
+        story.add_scene(
+            str(i+1),
+            scene_data.get('text', scene_data.get('description', 'Описание отсутствует.')),
+            choices,
+            not scene_data.get('choices', not scene_data.get('is_ending', False))
+        )
+
+    story.resolve_targets()
+    return story
+
+
+def convert_ai_array_to_graph_format(scene_list: list[dict], story_object: StoryObject) -> dict:
+    return convert_ai_array_to_compact(scene_list, story_object).to_dict()
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+import settings
+from storygen.compact import CompactStory
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    description TEXT,
+    params TEXT,
+    scene_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stories_created_at ON stories(created_at);
+"""
+
+
+def _fts_query(query: str) -> str:
+    # каждое слово ищется как префикс: так находятся и другие падежи
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in query.split())
+
+
+def _snippet(text: str, terms: list, width: int = 60) -> str:
+    lowered = text.lower()
+    positions = [p for p in (lowered.find(term.lower()) for term in terms) if p >= 0]
+    start = max(min(positions, default=0) - width // 2, 0)
+    fragment = text[start:start + width].replace("\n", " ")
+    return ("…" if start else "") + fragment + ("…" if start + width < len(text) else "")
+
+
+class StoryLibrary:
+    def __init__(self, path: str = settings.LIBRARY_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(_SCHEMA)
+        self.full_text = self._create_text_index()
+
+    def _create_text_index(self) -> bool:
+        row = self.connection.execute("SELECT sql FROM sqlite_master WHERE name = 'scene_text'").fetchone()
+        if row is not None:
+            return 'fts5' in row['sql'].lower()
+        try:
+            self.connection.execute("CREATE VIRTUAL TABLE scene_text USING fts5(text, story_id UNINDEXED, scene_id UNINDEXED)")
+            return True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite собран без FTS5, поиск по библиотеке будет медленнее")
+            self.connection.executescript("""
+                CREATE TABLE scene_text (text TEXT, story_id INTEGER, scene_id TEXT);
+                CREATE INDEX scene_text_story ON scene_text(story_id);
+            """)
+            return False
+
+    def add(self, story, story_object=None) -> int:
+        if not isinstance(story, CompactStory):
+            story = CompactStory.from_dict(story)
+        story_data = story.to_dict()
+        params = json.dumps(vars(story_object), ensure_ascii=False) if story_object is not None else None
+        data = zlib.compress(json.dumps(story_data, ensure_ascii=False).encode('utf-8'))
+        title, description = story_data.get('title'), story_data.get('description')
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO stories (title, description, params, scene_count, created_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (title, description, params, len(story), time.time(), data))
+            story_id = cursor.lastrowid
+            # строка без scene_id отвечает за название и описание истории
+            rows = [("\n".join(filter(None, (title, description))), story_id, None)]
+            rows += [(scene.get('text', ''), story_id, scene['scene_id']) for scene in story_data['scenes']]
+            self.connection.executemany("INSERT INTO scene_text (text, story_id, scene_id) VALUES (?, ?, ?)", rows)
+        return story_id
+
+    def get(self, story_id: int):
+        row = self.connection.execute("SELECT data FROM stories WHERE id = ?", (story_id,)).fetchone()
+        if row is None:
+            return None
+        return CompactStory.from_dict(json.loads(zlib.decompress(row['data']).decode('utf-8')))
+
+    def stories(self, limit: int = 50) -> list[dict]:
+        rows = self.connection.execute(
+            "SELECT id, title, description, params, scene_count, created_at FROM stories "
+            "ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [dict(row, params=json.loads(row['params']) if row['params'] else None) for row in rows]
+
+    def search(self, query: str, limit: int = 50) -> list[dict]:
+        terms = query.split()
+        if not terms:
+            return []
+        if self.full_text:
+            rows = self.connection.execute(
+                "SELECT scene_text.story_id, stories.title, scene_text.scene_id, "
+                "snippet(scene_text, 0, '«', '»', '…', 12) AS snippet "
+                "FROM scene_text JOIN stories ON stories.id = scene_text.story_id "
+                "WHERE scene_text MATCH ? ORDER BY rank LIMIT ?", (_fts_query(query), limit))
+            return [dict(row) for row in rows]
+
+        condition = " AND ".join("scene_text.text LIKE ? ESCAPE '\\'" for _ in terms)
+        patterns = ["%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for term in terms]
+        rows = self.connection.execute(
+            "SELECT scene_text.story_id, stories.title, scene_text.scene_id, scene_text.text "
+            "FROM scene_text JOIN stories ON stories.id = scene_text.story_id "
+            f"WHERE {condition} ORDER BY stories.created_at DESC LIMIT ?", (*patterns, limit))
+        return [{'story_id': row['story_id'], 'title': row['title'], 'scene_id': row['scene_id'],
+                 'snippet': _snippet(row['text'], terms)} for row in rows]
+
+    def delete(self, story_id: int) -> bool:
+        with self.connection:
+            self.connection.execute("DELETE FROM scene_text WHERE story_id = ?", (story_id,))
+            return self.connection.execute("DELETE FROM stories WHERE id = ?", (story_id,)).rowcount > 0
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+_default_library = None
+
+
+def get_default_library() -> StoryLibrary:
+    global _default_library
+    if _default_library is None:
+        _default_library = StoryLibrary()
+    return _default_library
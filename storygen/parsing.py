@@ -0,0 +1,378 @@
+import json
+import re
+
+
+_WHITESPACE = ' \t\r\n'
+_STRUCTURAL = '{}[],"\''
+_ESCAPES = {'"': '"', "'": "'", '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_STRING_SPECIAL = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_BARE_KEY = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_ARRAY_OF_OBJECTS = re.compile(r'\[\s*\{')
+_CHOICES_KEY = re.compile(r'choices["\']?\s*:\s*$')
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$', re.MULTILINE)
+_MISSING = object()
+
+
+class TolerantJSONParser:
+    def __init__(self, text: str):
+        self.text = text
+        self.n = len(text)
+        self.pos = 0
+        self.truncated = False
+        self.repairs = []
+        self.item_starts = []
+
+    def _repair(self, message):
+        self.repairs.append(f"{message} (позиция {self.pos})")
+
+    def _peek(self):
+        return self.text[self.pos] if self.pos < self.n else ''
+
+    def _skip_ws(self):
+        while self.pos < self.n and self.text[self.pos] in _WHITESPACE:
+            self.pos += 1
+
+    def _skip_junk(self):
+        start = self.pos
+        self.pos += 1
+        while self.pos < self.n and self.text[self.pos] not in _STRUCTURAL:
+            self.pos += 1
+        self.repairs.append(f"пропущен лишний текст {self.text[start:self.pos].strip()[:30]!r} (позиция {start})")
+
+    def _eof(self, message):
+        if not self.truncated:
+            self.truncated = True
+            self._repair(message)
+
+    def parse(self) -> list:
+        # массив сцен ищется по «[{»: фигурные скобки в тексте до него или обёртка {"scenes": [...]} его не подменяют;
+        # массив выборов означает, что открывающей скобки массива сцен нет
+        match = next((m for m in _ARRAY_OF_OBJECTS.finditer(self.text)
+                      if not _CHOICES_KEY.search(self.text, max(0, m.start() - 30), m.start())), None)
+        if match:
+            self.pos = match.start()
+        else:
+            starts = [i for i in (self.text.find('['), self.text.find('{')) if i != -1]
+            if not starts:
+                return []
+            self.pos = min(starts)
+        if self.text[:self.pos].replace('```json', '').replace('```', '').strip():
+            self._repair("пропущен текст перед JSON")
+
+        if self.text[self.pos] == '[':
+            self.pos += 1
+            items = self._parse_items(']', nested=False)
+        else:
+            self._repair("отсутствует открывающая скобка массива")
+            items = self._parse_items(None, nested=False)
+
+        if self.text[self.pos:].strip().strip('`').strip():
+            self._repair("пропущен текст после JSON")
+        return items
+
+    def _parse_items(self, closer, nested=True) -> list:
+        items = []
+        need_comma = after_comma = False
+        while True:
+            self._skip_ws()
+            ch = self._peek()
+            if not ch:
+                if closer:
+                    self._eof("массив обрезан в конце ответа")
+                return items
+            if ch == closer or (closer is None and ch == ']'):
+                if after_comma:
+                    self._repair("лишняя запятая перед закрывающей скобкой")
+                self.pos += 1
+                return items
+            if ch == ',':
+                if not need_comma:
+                    self._repair("лишняя запятая")
+                self.pos += 1
+                need_comma, after_comma = False, True
+                continue
+            if ch in '}]':
+                if nested:
+                    self._repair("пропущена закрывающая скобка массива")
+                    return items
+                self._skip_junk()
+                continue
+
+            start = self.pos
+            value = self._parse_value()
+            if value is _MISSING:
+                self._skip_junk()
+                continue
+            if need_comma:
+                self.repairs.append(f"пропущена запятая между элементами массива (элемент {len(items) + 1})")
+            if not nested:
+                self.item_starts.append(start)
+            items.append(value)
+            need_comma, after_comma = True, False
+
+    def _parse_object(self) -> dict:
+        self.pos += 1
+        obj = {}
+        need_comma = after_comma = False
+        comma_pos = None
+        while True:
+            self._skip_ws()
+            ch = self._peek()
+            if not ch:
+                self._eof("объект обрезан в конце ответа")
+                return obj
+            if ch == '}':
+                if after_comma:
+                    self._repair("лишняя запятая перед закрывающей скобкой")
+                self.pos += 1
+                return obj
+            if ch in ']{':
+                self._repair("пропущена закрывающая скобка объекта")
+                if ch == '{' and after_comma:
+                    # запятая относилась к внешнему массиву
+                    self.pos = comma_pos
+                return obj
+            if ch == ',':
+                if not need_comma:
+                    self._repair("лишняя запятая")
+                comma_pos = self.pos
+                self.pos += 1
+                need_comma, after_comma = False, True
+                continue
+
+            key = self._parse_key()
+            if key is _MISSING:
+                self._skip_junk()
+                continue
+            if need_comma:
+                self._repair("пропущена запятая между полями объекта")
+            need_comma, after_comma = True, False
+
+            self._skip_ws()
+            if not self._peek():
+                self._eof("объект обрезан в конце ответа")
+                return obj
+            if self._peek() == ':':
+                self.pos += 1
+            else:
+                self._repair(f"пропущено двоеточие после ключа {key!r}")
+            self._skip_ws()
+            if not self._peek():
+                self._eof("объект обрезан в конце ответа")
+                return obj
+
+            value = self._parse_value()
+            if value is _MISSING:
+                self._skip_junk()
+                continue
+            obj[key] = value
+
+    def _parse_key(self):
+        ch = self._peek()
+        if ch in '"\'':
+            return self._parse_string(ch)
+        match = _BARE_KEY.match(self.text, self.pos)
+        if match:
+            self._repair("ключ без кавычек")
+            self.pos = match.end()
+            return match.group()
+        return _MISSING
+
+    def _parse_value(self):
+        ch = self._peek()
+        if ch == '{':
+            return self._parse_object()
+        if ch == '[':
+            self.pos += 1
+            return self._parse_items(']')
+        if ch in '"\'':
+            return self._parse_string(ch)
+        match = _NUMBER.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            number = match.group()
+            return float(number) if any(c in number for c in '.eE') else int(number)
+        for literal, value in (('true', True), ('false', False), ('null', None)):
+            if self.text.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return value
+        return _MISSING
+
+    def _parse_string(self, quote) -> str:
+        if quote == "'":
+            self._repair("строка в одинарных кавычках")
+        special = _STRING_SPECIAL[quote]
+        self.pos += 1
+        chunks = []
+        while True:
+            match = special.search(self.text, self.pos)
+            if not match:
+                chunks.append(self.text[self.pos:])
+                self.pos = self.n
+                self._eof("строка обрезана в конце ответа")
+                break
+
+            i = match.start()
+            chunks.append(self.text[self.pos:i])
+            if self.text[i] == '\\':
+                esc = self.text[i + 1:i + 2]
+                if esc == 'u' and i + 6 <= self.n:
+                    try:
+                        chunks.append(chr(int(self.text[i + 2:i + 6], 16)))
+                        self.pos = i + 6
+                        continue
+                    except ValueError:
+                        pass
+                chunks.append(_ESCAPES.get(esc, esc))
+                self.pos = i + 2
+                continue
+
+            # кавычка закрывает строку, только если за ней идёт разделитель
+            j = i + 1
+            while j < self.n and self.text[j] in _WHITESPACE:
+                j += 1
+            if j >= self.n or self.text[j] in ',:}]"\'':
+                self.pos = i + 1
+                break
+            chunks.append(quote)
+            self.pos = i + 1
+            if not self.repairs or not self.repairs[-1].startswith("неэкранированная кавычка"):
+                self.repairs.append(f"неэкранированная кавычка внутри строки (позиция {i})")
+
+        value = ''.join(chunks)
+        if any('\ud800' <= c <= '\udfff' for c in value):
+            value = value.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+        return value
+
+
+def _scene_list(value):
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        if 'scene_id' in value:
+            return [value]
+        for item in value.values():
+            if isinstance(item, list) and item and all(isinstance(scene, dict) for scene in item):
+                return item
+    return None
+
+
+def _parse_strict(text: str):
+    # корректный ответ разбирается json.loads, посимвольный разбор нужен только для сломанного
+    stripped = _FENCE.sub('', text).strip()
+    start, end = stripped.find('['), stripped.rfind(']')
+    candidates = [stripped] if stripped.startswith(('[', '{')) else []
+    if 0 <= start < end:
+        candidates.append(stripped[start:end + 1])
+    for candidate in candidates:
+        try:
+            scenes = _scene_list(json.loads(candidate))
+        except json.JSONDecodeError:
+            continue
+        if scenes is not None:
+            return scenes
+    return None
+
+
+def parse_scenes_with_fragments(text: str) -> tuple[list[dict], list[str], list[str]]:
+    items = _parse_strict(text)
+    if items is not None:
+        repairs, item_starts, truncated = [], [0] * len(items), False
+    else:
+        parser = TolerantJSONParser(text)
+        items = parser.parse()
+        repairs, item_starts, truncated = parser.repairs, parser.item_starts, parser.truncated
+
+    scenes = []
+    scene_starts = []
+    for k, (item, start) in enumerate(zip(items, item_starts)):
+        if not isinstance(item, dict):
+            repairs.append("пропущен элемент массива, не являющийся сценой")
+            continue
+        # обрезанная последняя сцена ниже уходит в сломанные фрагменты, а не пропадает молча
+        if not ('scene_id' in item or 'text' in item or 'description' in item) and \
+                not (truncated and k == len(items) - 1):
+            repairs.append("пропущен объект без scene_id и текста")
+            continue
+        choices = item.get('choices')
+        if isinstance(choices, list):
+            valid_choices = [c for c in choices if isinstance(c, dict) and c.get('next_scene')]
+            if len(valid_choices) != len(choices):
+                repairs.append(f"отброшены неполные выборы в сцене {item.get('scene_id', len(scenes) + 1)}")
+            item['choices'] = valid_choices
+        scenes.append(item)
+        scene_starts.append(start)
+
+    broken_fragments = []
+    if truncated and scenes:
+        last = scenes[-1]
+        if 'scene_id' not in last or not ('text' in last or 'description' in last):
+            scenes.pop()
+            broken_fragments.append(text[scene_starts.pop():])
+            repairs.append("отброшена незавершённая последняя сцена")
+
+    if not scenes:
+        raise json.JSONDecodeError("Не удалось найти валидный JSON-массив в ответе.", text, 0)
+    return scenes, repairs, broken_fragments
+
+
+def parse_scene_array(text: str) -> tuple[list[dict], list[str]]:
+    scenes, repairs, _ = parse_scenes_with_fragments(text)
+    return scenes, repairs
+
+
+def clean_json_response(text: str) -> str:
+    scenes, _ = parse_scene_array(text)
+    return json.dumps(scenes, ensure_ascii=False)
+
+
+class SceneStreamParser:
+    def __init__(self):
+        self.in_array = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.buffer = []
+
+    def feed(self, chunk: str) -> list[dict]:
+        scenes = []
+        for ch in chunk:
+            if not self.in_array:
+                if ch == '[':
+                    self.in_array = True
+                continue
+
+            if self.depth > 0:
+                self.buffer.append(ch)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                if self.depth == 0:
+                    if ch == '[':
+                        continue
+                    self.buffer = [ch]
+                self.depth += 1
+            elif ch in '}]':
+                if self.depth == 0:
+                    continue
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        scene = json.loads(''.join(self.buffer))
+                    except json.JSONDecodeError:
+                        scene = None
+                    if isinstance(scene, dict):
+                        scenes.append(scene)
+                    self.buffer = []
+        return scenes
@@ -0,0 +1,322 @@
+from StoryObject import StoryObject
+
+
+def build_prompt(story_object: StoryObject, folder_id: str, stream: bool = False) -> dict:
+    return {
+        "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
+        "completionOptions": {
+            "stream": stream,
+            "temperature": 0.75,
+            "maxTokens": "16000"
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": """Ты — профессиональный сценарист для RPG.
+                Твоя задача — сгенерировать ЕДИНЫЙ JSON-МАССИВ, где каждый элемент — это одна сцена квеста.
+                
+                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
+                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
+                2.  **СТРУКТУРА ОБЪЕКТА**: Каждый объект в массиве должен иметь СТРОГУЮ структуру:
+                    {
+                      "scene_id": "1",  
+                      "text": "Полное, насыщенное описание сцены (80-150 слов).",
+                      "choices": [
+                        {"text": "Краткое описание выбора (2-5 слов)", "next_scene": "2"}
+                      ]
+                    }
+                3.  **ЗАПЯТЫЕ**: Между КАЖДЫМ объектом в массиве (например, между `}` и `{`) ДОЛЖНА стоять запятая.
+                4.  **ID СЦЕН**: scene_id должны быть последовательными числами от 1 до N в виде строк ("1", "2", "3" и т.д.)
+                5.  **КОНЦОВКИ**: Создай минимум две концовки (сцены без choices)
+                6.  **ВЕТВЛЕНИЕ**: Создай ветвление сюжета с уникальными путями
+                
+                ТРЕБОВАНИЯ К КОНТЕНТУ:
+                -   **Жанр**: Строго Ролевая игра (RPG).
+                -   **Язык**: Русский.
+                -   **Количество сцен**: От 6 до 12.
+                """
+            },
+            {
+                "role": "user",
+                "text": f"""Создай RPG квест по параметрам:
+                - **Описание**: {story_object.description}
+                - **Жанр**: {story_object.genre}
+                - **Персонажи**: {', '.join(story_object.heroes)}
+                - **Настроение**: {story_object.mood}
+                """
+            }
+        ]
+    }
+
+
+def _story_parameters(story_object: StoryObject) -> str:
+    return f"""- **Описание**: {story_object.description}
+                - **Жанр**: {story_object.genre}
+                - **Персонажи**: {', '.join(story_object.heroes)}
+                - **Настроение**: {story_object.mood}
+                """
+
+
+def build_outline_prompt(story_object: StoryObject, folder_id: str, scene_count: int) -> dict:
+    return {
+        "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0.75,
+            "maxTokens": "16000"
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": f"""Ты — профессиональный сценарист для RPG.
+                Твоя задача — составить ПЛАН большого квеста в виде ЕДИНОГО JSON-МАССИВА, где каждый элемент — одна сцена.
+                
+                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
+                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
+                2.  **СТРУКТУРА ОБЪЕКТА**:
+                    {{
+                      "scene_id": "1",
+                      "summary": "Краткое содержание сцены (1-2 предложения).",
+                      "choices": [
+                        {{"text": "Краткое описание выбора (2-5 слов)", "next_scene": "2"}}
+                      ]
+                    }}
+                3.  **ЗАПЯТЫЕ**: Между КАЖДЫМ объектом в массиве ДОЛЖНА стоять запятая.
+                4.  **ID СЦЕН**: scene_id должны быть последовательными числами от 1 до {scene_count} в виде строк.
+                5.  **КОНЦОВКИ**: Создай несколько концовок (сцены без choices).
+                6.  **ВЕТВЛЕНИЕ**: Каждый next_scene должен ссылаться на существующую сцену.
+                
+                ТРЕБОВАНИЯ К КОНТЕНТУ:
+                -   **Язык**: Русский.
+                -   **Количество сцен**: Ровно {scene_count}.
+                """
+            },
+            {
+                "role": "user",
+                "text": f"""Составь план квеста по параметрам:
+                {_story_parameters(story_object)}"""
+            }
+        ]
+    }
+
+
+def build_acts_prompt(story_object: StoryObject, folder_id: str, acts: list[tuple[str, str]]) -> dict:
+    ranges = "\n".join(f"Акт {i + 1}: сцены {first}-{last}" for i, (first, last) in enumerate(acts))
+    return {
+        "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0.75,
+            "maxTokens": "4000"
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": f"""Ты — профессиональный сценарист для RPG.
+                Твоя задача — разбить большой квест на акты и кратко описать каждый акт в виде ЕДИНОГО JSON-МАССИВА.
+                
+                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
+                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
+                2.  **СТРУКТУРА ОБЪЕКТА**: {{"act_id": "1", "text": "Краткое содержание акта (2-3 предложения)."}}
+                3.  **АКТЫ**: Ровно {len(acts)} актов, каждый продолжает предыдущий; в последнем акте квест завершается.
+                4.  **Язык**: Русский.
+                """
+            },
+            {
+                "role": "user",
+                "text": f"""Опиши акты квеста по параметрам:
+                {_story_parameters(story_object)}
+                Акты:
+{ranges}"""
+            }
+        ]
+    }
+
+
+def build_act_outline_prompt(story_object: StoryObject, folder_id: str, act_summaries: list[str], act: int,
+                             first_id: int, last_id: int) -> dict:
+    # план каждого акта - отдельный ответ: размер квеста не упирается в maxTokens одного запроса
+    acts = "\n".join(f"Акт {i + 1}: {summary}" for i, summary in enumerate(act_summaries))
+    last_act = act == len(act_summaries) - 1
+    exits = ("Создай несколько концовок (сцены без choices)." if last_act else
+             f"Хотя бы один выбор должен вести в сцену {last_id + 1} — начало следующего акта.")
+    return {
+        "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0.75,
+            "maxTokens": "8000"
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": f"""Ты — профессиональный сценарист для RPG.
+                Твоя задача — составить ПЛАН одного акта большого квеста в виде ЕДИНОГО JSON-МАССИВА, где каждый элемент — одна сцена.
+                
+                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
+                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
+                2.  **СТРУКТУРА ОБЪЕКТА**:
+                    {{
+                      "scene_id": "{first_id}",
+                      "summary": "Краткое содержание сцены (1-2 предложения).",
+                      "choices": [
+                        {{"text": "Краткое описание выбора (2-5 слов)", "next_scene": "{first_id + 1}"}}
+                      ]
+                    }}
+                3.  **ЗАПЯТЫЕ**: Между КАЖДЫМ объектом в массиве ДОЛЖНА стоять запятая.
+                4.  **ID СЦЕН**: scene_id — последовательные числа от {first_id} до {last_id} в виде строк, акт начинается со сцены {first_id}.
+                5.  **ВЕТВЛЕНИЕ**: next_scene ссылается на сцены от {first_id} до {last_id}{'' if last_act else f' или на сцену {last_id + 1}'}.
+                6.  **ВЫХОД ИЗ АКТА**: {exits}
+                
+                ТРЕБОВАНИЯ К КОНТЕНТУ:
+                -   **Язык**: Русский.
+                -   **Количество сцен**: Ровно {last_id - first_id + 1}.
+                """
+            },
+            {
+                "role": "user",
+                "text": f"""Параметры квеста:
+                {_story_parameters(story_object)}
+                Акты квеста:
+{acts}
+
+                Составь план акта {act + 1}."""
+            }
+        ]
+    }
+
+
+def _format_outline(outline: list[dict]) -> str:
+    lines = []
+    for i, scene in enumerate(outline):
+        choices = ", ".join(f"«{c.get('text', '...')}» → {c.get('next_scene', '')}" for c in scene.get('choices', []))
+        lines.append(f"{scene.get('scene_id', i + 1)}: {scene.get('summary', '')} (выборы: {choices or 'концовка'})")
+    return "\n".join(lines)
+
+
+def _format_summaries(outline: list[dict]) -> str:
+    return "\n".join(f"{scene.get('scene_id')}: {scene.get('summary', '')}" for scene in outline)
+
+
+def build_expand_prompt(story_object: StoryObject, folder_id: str, scenes: list[dict], neighbours: list[dict]) -> dict:
+    # только сцены пачки и краткие планы соседних: размер запроса не растёт вместе с квестом
+    return {
+        "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0.75,
+            "maxTokens": "8000"
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": """Ты — профессиональный сценарист для RPG.
+                По плану квеста напиши полные тексты ТОЛЬКО для перечисленных сцен.
+                
+                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
+                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
+                2.  **СТРУКТУРА ОБЪЕКТА**: {"scene_id": "1", "text": "Полное, насыщенное описание сцены (80-150 слов)."}
+                3.  **СОГЛАСОВАННОСТЬ**: Текст должен соответствовать плану и подводить к выборам сцены.
+                4.  **Язык**: Русский.
+                """
+            },
+            {
+                "role": "user",
+                "text": f"""Параметры квеста:
+                {_story_parameters(story_object)}
+                Соседние сцены (откуда в них приходят и куда ведут выборы):
+{_format_summaries(neighbours) or 'нет'}
+
+                План сцен, для которых нужно написать тексты:
+{_format_outline(scenes)}
+
+                Напиши тексты для сцен: {', '.join(str(s.get('scene_id')) for s in scenes)}
+                """
+            }
+        ]
+    }
+
+
+def build_repair_prompt(folder_id: str, fragment: str) -> dict:
+    return {
+        "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0.1,
+            "maxTokens": "4000"
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": """Ты исправляешь синтаксис JSON. Не придумывай новый сюжет.
+                
+                ПРАВИЛА:
+                1.  Верни ТОЛЬКО валидный JSON-массив `[ ... ]` сцен из присланного фрагмента. Без комментариев и markdown.
+                2.  Каждая сцена: {"scene_id": "...", "text": "...", "choices": [{"text": "...", "next_scene": "..."}]}
+                3.  Сохрани scene_id, тексты и выборы без изменений.
+                4.  Если сцена обрезана, заверши текст одним предложением и закрой все скобки; недописанные выборы убери.
+                """
+            },
+            {
+                "role": "user",
+                "text": fragment
+            }
+        ]
+    }
+
+
+def _format_path(path: list) -> str:
+    return "\n".join(f"{scene_id}: {text} → выбор «{choice_text}»" for scene_id, text, choice_text in path)
+
+
+def _format_scenes(scenes: list[dict]) -> str:
+    lines = []
+    for scene in scenes:
+        choices = ", ".join(f"«{c.get('text', '...')}» → {c.get('next_scene', '')}" for c in scene.get('choices', []))
+        lines.append(f"{scene['scene_id']}: {scene.get('text', '')} (выборы: {choices or 'концовка'})")
+    return "\n".join(lines)
+
+
+def _format_targets(targets: list[dict]) -> str:
+    return "\n".join(f"{scene['scene_id']}: {scene.get('text', '')}" for scene in targets)
+
+
+def build_regenerate_prompt(story_object: StoryObject, folder_id: str, path: list, scenes: list[dict],
+                            targets: list[dict]) -> dict:
+    return {
+        "modelUri": f"gpt://{folder_id}/yandexgpt-lite",
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0.9,
+            "maxTokens": "4000"
+        },
+        "messages": [
+            {
+                "role": "system",
+                "text": """Ты — профессиональный сценарист для RPG.
+                Перепиши ТОЛЬКО перечисленные сцены квеста, сохранив их место в сюжете.
+                
+                КРИТИЧЕСКИ ВАЖНЫЕ ПРАВИЛА:
+                1.  **ФОРМАТ ВЫВОДА**: Верни ТОЛЬКО валидный JSON-массив `[ ... ]`. Без комментариев и markdown.
+                2.  **СТРУКТУРА ОБЪЕКТА**: {"scene_id": "1", "text": "Полное, насыщенное описание сцены (80-150 слов).", "choices": [{"text": "Краткое описание выбора (2-5 слов)", "next_scene": "2"}]}
+                3.  **ПЕРЕХОДЫ**: Сохрани scene_id и next_scene каждого выбора без изменений, меняй только тексты.
+                4.  **СОГЛАСОВАННОСТЬ**: Сцены должны продолжать путь игрока и подводить к сценам, в которые ведут выборы.
+                5.  **Язык**: Русский.
+                """
+            },
+            {
+                "role": "user",
+                "text": f"""Параметры квеста:
+                {_story_parameters(story_object)}
+                Путь игрока до сцены:
+{_format_path(path) or 'начало квеста'}
+
+                Сцены, в которые ведут выборы:
+{_format_targets(targets) or 'нет'}
+
+                Перепиши сцены:
+{_format_scenes(scenes)}
+                """
+            }
+        ]
+    }
@@ -0,0 +1,91 @@
+import settings
+from storygen.analysis import analyze_story
+
+
+def _excerpt(text, limit: int = settings.REGENERATE_EXCERPT_CHARS) -> str:
+    text = ' '.join(str(text or '').split())
+    return text if len(text) <= limit else text[:limit].rstrip() + '…'
+
+
+def ancestor_path(analysis, scene_id) -> list:
+    # кратчайший путь от начальной сцены: его и видит модель вместо всей истории
+    if scene_id not in analysis.levels:
+        return []
+    parents = {analysis.start_scene: None}
+    queue = [analysis.start_scene]; head = 0
+    while head < len(queue) and scene_id not in parents:
+        u = queue[head]; head += 1
+        for v in analysis.successors[u]:
+            if v not in parents:
+                parents[v] = u
+                queue.append(v)
+    path = []
+    node = parents[scene_id]
+    while node is not None:
+        path.append(node)
+        node = parents[node]
+    return path[::-1]
+
+
+def subtree_ids(analysis, scene_id, limit: int = settings.REGENERATE_SUBTREE_LIMIT) -> list:
+    # в ветку входят только сцены, в которые нельзя попасть в обход выбранной:
+    # общие сцены других веток остаются как есть и служат границей
+    order = [scene_id]; seen = {scene_id}; head = 0
+    while head < len(order):
+        for v in analysis.successors[order[head]]:
+            if v not in seen:
+                seen.add(v)
+                order.append(v)
+        head += 1
+
+    predecessors = {}
+    for u, targets in analysis.successors.items():
+        for v in targets:
+            predecessors.setdefault(v, []).append(u)
+
+    members = set(order[:limit])
+    changed = True
+    while changed:
+        changed = False
+        for node in list(members):
+            if node != scene_id and any(p not in members for p in predecessors.get(node, [])):
+                members.discard(node)
+                changed = True
+    return [node for node in order if node in members]
+
+
+class RegenerationContext:
+    def __init__(self, story, scene_id, subtree: bool = False, analysis=None):
+        analysis = analysis if analysis is not None else analyze_story(story)
+        scene_id = str(scene_id)
+        if scene_id not in analysis.successors:
+            raise ValueError(f"Сцена {scene_id} не найдена.")
+        self.story = story
+        self.scene_id = scene_id
+        self.scene_ids = subtree_ids(analysis, scene_id) if subtree else [scene_id]
+
+        path = ancestor_path(analysis, scene_id) + [scene_id]
+        self.path = [(node, _excerpt(story.text(story.index_of(node))),
+                      story.edge_label(node, path[k + 1]) if k + 1 < len(path) else None)
+                     for k, node in enumerate(path[:-1])]
+        self.scenes = [story.scene(story.index_of(node)) for node in self.scene_ids]
+
+        members = set(self.scene_ids)
+        boundary = dict.fromkeys(t for node in self.scene_ids for t in analysis.successors[node] if t not in members)
+        self.targets = [{'scene_id': node, 'text': _excerpt(story.text(story.index_of(node)))} for node in boundary]
+
+    def merge(self, scene_list: list[dict]) -> list[dict]:
+        # переходы сохраняются: модель переписывает тексты, но не может оторвать ветку от графа
+        generated = {str(scene.get('scene_id')): scene for scene in scene_list if isinstance(scene, dict)}
+        merged = []
+        for scene in self.scenes:
+            new_scene = generated.get(scene['scene_id'])
+            if new_scene is None:
+                continue
+            targets = {c['next_scene'] for c in scene['choices']}
+            choices = [{'text': str(c.get('text') or '...'), 'next_scene': str(c.get('next_scene'))}
+                       for c in new_scene.get('choices') or [] if str(c.get('next_scene')) in targets]
+            if {c['next_scene'] for c in choices} != targets:
+                choices = scene['choices']
+            merged.append({**scene, 'text': new_scene.get('text') or scene.get('text'), 'choices': choices})
+        return merged
@@ -0,0 +1,119 @@
+import json
+import os
+import struct
+import zlib
+from array import array
+
+from cache import LRUCache
+from storygen.compact import CompactStory, lazy_text_ref
+
+MAGIC = b'GSGSTORY'
+VERSION = 1
+STORY_EXTENSION = '.gsg'
+
+# заголовок: сигнатура, версия, длина сжатой топологии; дальше идут сжатые по отдельности тексты сцен
+_HEADER = struct.Struct('<8sHI')
+
+
+class StoryArchive:
+    def __init__(self, path: str, data_offset: int, spans: list, cache_size: int = 32):
+        self.path = path
+        self.data_offset = data_offset
+        self.spans = spans
+        self._cache = LRUCache(cache_size)
+
+    def load(self, n: int) -> str:
+        text = self._cache.get(n)
+        if text is None:
+            offset, length = self.spans[n]
+            with open(self.path, 'rb') as f:
+                f.seek(self.data_offset + offset)
+                text = zlib.decompress(f.read(length)).decode('utf-8')
+            self._cache.put(n, text)
+        return text
+
+
+def is_story_archive(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save_story(story, path: str):
+    if not isinstance(story, CompactStory):
+        story = CompactStory.from_dict(story)
+
+    blocks = []
+    spans = []
+    offset = 0
+    for i in range(len(story)):
+        text = story.text(i) if story.texts[i] != -1 else None
+        if text is None:
+            spans.append(None); continue
+        block = zlib.compress(text.encode('utf-8'))
+        blocks.append(block)
+        spans.append((offset, len(block)))
+        offset += len(block)
+
+    get = story.strings.get
+    topology = {
+        'title': story.get('title'),
+        'description': story.get('description'),
+        'start_scene': story.get('start_scene'),
+        'scene_ids': [get(s) for s in story.scene_ids],
+        'endings': list(story.endings),
+        'choice_offsets': list(story.choice_offsets),
+        'choice_texts': [get(s) for s in story.choice_texts],
+        'choice_targets': [get(s) for s in story.choice_target_ids],
+        'text_spans': spans,
+    }
+    packed = zlib.compress(json.dumps(topology, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(packed)))
+        f.write(packed)
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp_path, path)
+
+    if story.text_source is not None:
+        # старые смещения могли указывать в перезаписанный файл: ленивые тексты читаются уже из нового
+        story.text_source = StoryArchive(path, _HEADER.size + len(packed), spans)
+        story.texts = array('i', (-1 if span is None else lazy_text_ref(i) for i, span in enumerate(spans)))
+
+
+def _load_archive(path: str, lazy: bool) -> CompactStory:
+    with open(path, 'rb') as f:
+        magic, version, packed_size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Файл {path} не является архивом истории.")
+        if version != VERSION:
+            raise ValueError(f"Неподдерживаемая версия архива истории: {version}.")
+        topology = json.loads(zlib.decompress(f.read(packed_size)).decode('utf-8'))
+
+    story = CompactStory()
+    intern = story.strings.intern
+    story.title = intern(topology.get('title'))
+    story.description = intern(topology.get('description'))
+    story.start_scene = intern(topology.get('start_scene'))
+    story.scene_ids = array('i', map(intern, topology['scene_ids']))
+    story.endings = array('b', topology['endings'])
+    story.choice_offsets = array('i', topology['choice_offsets'])
+    story.choice_texts = array('i', map(intern, topology['choice_texts']))
+    story.choice_target_ids = array('i', map(intern, topology['choice_targets']))
+    story.resolve_targets()
+
+    spans = topology['text_spans']
+    story.text_source = StoryArchive(path, _HEADER.size + packed_size, spans)
+    story.texts = array('i', (-1 if span is None else lazy_text_ref(i) for i, span in enumerate(spans)))
+    if not lazy:
+        story.texts = array('i', (-1 if span is None else intern(story.text(i)) for i, span in enumerate(spans)))
+        story.text_source = None
+    return story
+
+
+def load_story(path: str, lazy: bool = True) -> CompactStory:
+    if is_story_archive(path):
+        return _load_archive(path, lazy)
+    with open(path, 'r', encoding='utf-8') as f:
+        return CompactStory.from_dict(json.load(f))
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+import ai
+
+GOOD_SCENES = [{'scene_id': str(i), 'text': f'Сцена {i}', 'choices': [{'text': 'Дальше', 'next_scene': str(i + 1)}]}
+               for i in range(1, 7)]
+TRUNCATED = json.dumps(GOOD_SCENES, ensure_ascii=False)[:-1] + ', {"scene_id": "7", "te'
+
+
+def bad_request():
+    url = URL(ai.COMPLETION_URL)
+    request_info = aiohttp.RequestInfo(url, 'POST', CIMultiDictProxy(CIMultiDict()), url)
+    return aiohttp.ClientResponseError(request_info, (), status=400, message='Bad Request')
+
+
+def test_failed_repair_request_keeps_parsed_scenes(monkeypatch):
+    async def failing_completion(session, prompt, on_scene=None):
+        raise bad_request()
+
+    monkeypatch.setattr(ai.settings, 'AI_REPAIR_REQUESTS', True)
+    monkeypatch.setattr(ai, '_complete_with_retries', failing_completion)
+    assert asyncio.run(ai._parse_scenes(None, TRUNCATED)) == GOOD_SCENES
+
+
+def test_failed_repair_request_without_parsed_scenes_raises(monkeypatch):
+    async def failing_completion(session, prompt, on_scene=None):
+        raise bad_request()
+
+    monkeypatch.setattr(ai.settings, 'AI_REPAIR_REQUESTS', True)
+    monkeypatch.setattr(ai, '_complete_with_retries', failing_completion)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(ai._parse_scenes(None, 'Не могу сгенерировать квест.'))
+
+
+def test_streamed_completion_reads_lines_longer_than_the_read_buffer():
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    text = json.dumps(GOOD_SCENES * 4000, ensure_ascii=False)
+    assert len(text.encode('utf-8')) > 128 * 1024
+    lines = [json.dumps({'result': {'alternatives': [{'message': {'text': text[:end]}}]}}, ensure_ascii=False)
+             for end in (len(text) // 2, len(text))]
+
+    async def handler(request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for line in lines:
+            await response.write((line + '\n').encode('utf-8'))
+        await response.write_eof()
+        return response
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post('/', handler)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            async with session.post(server.make_url('/')) as response:
+                return await ai._read_streamed_completion(response, lambda scene: None)
+
+    generated_text, _ = asyncio.run(scenario())
+    assert generated_text == text
+
+
+def fake_completions(prompts):
+    async def complete(session, prompt, cache):
+        prompts.append(prompt)
+        system, user = (message['text'] for message in prompt['messages'])
+        if 'разбить большой квест на акты' in system:
+            return [{'act_id': str(i), 'text': f'Акт {i}'} for i in range(1, user.count('Акт ') + 1)]
+        if 'ПЛАН одного акта' in system:
+            first, last = (int(x) for x in system.split('последовательные числа от ')[1].split(' в виде')[0].split(' до '))
+            return [{'scene_id': str(i), 'summary': f'План {i}',
+                     'choices': [{'text': 'Дальше', 'next_scene': str(i + 1)}] if i < 100 else []}
+                    for i in range(first, last + 1)]
+        ids = user.rsplit('Напиши тексты для сцен: ', 1)[1].strip().split(', ')
+        return [{'scene_id': scene_id, 'text': f'Текст {scene_id}'} for scene_id in ids]
+    return complete
+
+
+def test_large_story_outlines_by_acts_and_expands_with_local_context(monkeypatch):
+    from StoryObject import StoryObject
+
+    prompts = []
+    monkeypatch.setattr(ai, 'YANDEX_API_KEY', 'key')
+    monkeypatch.setattr(ai, 'YANDEX_ID_KEY', 'folder')
+    monkeypatch.setattr(ai.settings, 'OUTLINE_ACT_SCENES', 30)
+    monkeypatch.setattr(ai, '_complete_scenes', fake_completions(prompts))
+
+    story = StoryObject('Описание', 'фэнтези', 'Эльф', 'epic')
+    story_data = asyncio.run(ai.get_large_story_from_ai(story, 100, batch_size=5, use_cache=False))
+
+    assert len(story_data['scenes']) == 100
+    assert all(scene['text'].startswith('Текст') for scene in story_data['scenes'])
+    assert len(prompts) == 1 + 4 + 20
+
+    expand = [p['messages'][1]['text'] for p in prompts[5:]]
+    assert all(f'План {i}' in expand[9] for i in range(45, 52))
+    assert 'План 44' not in expand[9] and 'План 52' not in expand[9]
+    assert max(map(len, expand)) < 2 * min(map(len, expand))
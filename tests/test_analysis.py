@@ -0,0 +1,31 @@
+from storygen.analysis import analyze_story
+from storygen.compact import CompactStory
+
+
+def make_story():
+    return CompactStory.from_dict({'start_scene': '1', 'scenes': [
+        {'scene_id': '1', 'text': 'Начало', 'choices': [{'text': 'Налево', 'next_scene': '2'},
+                                                        {'text': 'В пустоту', 'next_scene': 'X'}]},
+        {'scene_id': '2', 'text': 'Конец', 'choices': []},
+    ]})
+
+
+def test_analysis_finds_dangling_choices_and_endings():
+    analysis = analyze_story(make_story())
+    assert analysis.dangling == [('1', 'В пустоту', 'X')]
+    assert analysis.endings == ['2']
+    assert analysis.levels == {'1': 0, '2': 1}
+
+
+def test_cached_analysis_follows_choice_text_edits():
+    story = make_story()
+    analyze_story(story)
+    story.set_choices(0, [('Налево', '2'), ('В бездну', 'X')])
+    assert analyze_story(story).dangling == [('1', 'В бездну', 'X')]
+
+
+def test_cached_analysis_follows_scene_order():
+    story = make_story()
+    reordered = CompactStory.from_dict({'start_scene': '1', 'scenes': list(reversed(story.to_dict()['scenes']))})
+    assert analyze_story(story).scene_ids == ['1', '2']
+    assert analyze_story(reordered).scene_ids == ['2', '1']
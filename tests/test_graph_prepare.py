@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('networkx')
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import graph_prepare
+from benchmarks.synthetic import generate_story
+
+
+class BrokenExecutor:
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("процесс завершился"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def pool_for_every_story(monkeypatch):
+    monkeypatch.setattr(graph_prepare.settings, 'PREPARE_POOL_MIN_SCENES', 0)
+    yield
+    graph_prepare.shutdown_executor()
+
+
+def test_broken_pool_falls_back_to_thread_and_is_recreated(monkeypatch, pool_for_every_story):
+    broken = BrokenExecutor()
+    monkeypatch.setattr(graph_prepare, '_executor', broken)
+    story = generate_story(30)
+
+    prepared = graph_prepare.submit_prepare(story).result(timeout=30)
+
+    assert len(prepared.node_ids) == 30
+    assert broken.shut_down
+    assert graph_prepare._executor is None
+
+
+def test_errors_in_story_data_reach_the_future(monkeypatch, pool_for_every_story):
+    monkeypatch.setattr(graph_prepare, '_executor', BrokenExecutor())
+    future = graph_prepare.submit_prepare({'scenes': [{'text': 'Сцена без scene_id'}]})
+    with pytest.raises(KeyError):
+        future.result(timeout=30)
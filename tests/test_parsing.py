@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from storygen.parsing import SceneStreamParser, clean_json_response, parse_scene_array, parse_scenes_with_fragments
+
+SCENE_1 = {'scene_id': '1', 'text': 'Начало', 'choices': [{'text': 'Вперёд', 'next_scene': '2'}]}
+SCENE_2 = {'scene_id': '2', 'text': 'Конец', 'choices': []}
+VALID = json.dumps([SCENE_1, SCENE_2], ensure_ascii=False)
+SCENE_1_TEXT = json.dumps(SCENE_1, ensure_ascii=False)
+SCENE_2_TEXT = json.dumps(SCENE_2, ensure_ascii=False)
+
+
+@pytest.mark.parametrize('text', [
+    VALID,
+    f"```json\n{VALID}\n```",
+    f"Вот квест:\n{VALID}\nУдачной игры!",
+    f"Вот квест {{2 сцены}}: {VALID}",
+    json.dumps({'scenes': [SCENE_1, SCENE_2]}, ensure_ascii=False),
+], ids=['valid', 'fenced', 'prose-around', 'brace-in-prose', 'wrapper-object'])
+def test_valid_arrays_need_no_repairs(text):
+    scenes, repairs = parse_scene_array(text)
+    assert scenes == [SCENE_1, SCENE_2]
+    assert repairs == []
+
+
+@pytest.mark.parametrize('text, repair', [
+    (f"[{SCENE_1_TEXT} {SCENE_2_TEXT}]", "пропущена запятая между элементами массива"),
+    (f"[{SCENE_1_TEXT}, {SCENE_2_TEXT},]", "лишняя запятая перед закрывающей скобкой"),
+    (f"[{SCENE_1_TEXT},, {SCENE_2_TEXT}]", "лишняя запятая"),
+    (f"{SCENE_1_TEXT}, {SCENE_2_TEXT}]", "отсутствует открывающая скобка массива"),
+    (f"Вот квест: [{SCENE_1_TEXT} {SCENE_2_TEXT}]", "пропущен текст перед JSON"),
+    (f"[{SCENE_1_TEXT} {SCENE_2_TEXT}] Удачной игры!", "пропущен текст после JSON"),
+    (f"[{SCENE_1_TEXT} сцена 2: {SCENE_2_TEXT}]", "пропущен лишний текст"),
+    ("[{scene_id: '1', text: 'Начало', choices: [{text: 'Вперёд', next_scene: '2'}]}, " + SCENE_2_TEXT + "]",
+     "ключ без кавычек"),
+    ("[{scene_id: '1', text: 'Начало', choices: [{text: 'Вперёд', next_scene: '2'}]}, " + SCENE_2_TEXT + "]",
+     "строка в одинарных кавычках"),
+    ('[{"scene_id": "1" "text": "Начало", "choices": [{"text": "Вперёд", "next_scene": "2"}]}, '
+     + SCENE_2_TEXT + "]", "пропущена запятая между полями объекта"),
+    ('[{"scene_id": "1", "text" "Начало", "choices": [{"text": "Вперёд", "next_scene": "2"}]}, '
+     + SCENE_2_TEXT + "]", "пропущено двоеточие после ключа"),
+    ('[{"scene_id": "1", "text": "Начало", "choices": [{"text": "Вперёд", "next_scene": "2"}], '
+     + SCENE_2_TEXT + "]", "пропущена закрывающая скобка объекта"),
+    ('[{"scene_id": "1", "text": "Начало", "choices": [{"text": "Вперёд", "next_scene": "2"}}, '
+     + SCENE_2_TEXT + "]", "пропущена закрывающая скобка массива"),
+    (f"Вот квест {{2 сцены}}: [{SCENE_1_TEXT} {SCENE_2_TEXT}]", "пропущен текст перед JSON"),
+    ('{"scenes": [' + SCENE_1_TEXT + ' ' + SCENE_2_TEXT + ']}', "пропущен текст после JSON"),
+], ids=['missing-comma', 'trailing-comma', 'double-comma', 'missing-open-bracket', 'prose-before',
+        'prose-after', 'prose-between', 'bare-keys', 'single-quotes', 'missing-field-comma', 'missing-colon',
+        'missing-object-brace', 'missing-array-bracket', 'brace-in-prose', 'wrapper-object'])
+def test_repairs(text, repair):
+    scenes, repairs = parse_scene_array(text)
+    assert scenes == [SCENE_1, SCENE_2]
+    assert any(r.startswith(repair) for r in repairs), repairs
+
+
+def test_unescaped_quote_inside_text():
+    scenes, repairs = parse_scene_array('[{"scene_id": "1", "text": "Трактир "Пони" закрыт", "choices": []}]')
+    assert scenes[0]['text'] == 'Трактир "Пони" закрыт'
+    assert any(r.startswith("неэкранированная кавычка") for r in repairs)
+
+
+def test_incomplete_choices_are_dropped():
+    scenes, repairs = parse_scene_array(
+        '[{"scene_id": "1", "text": "Начало", "choices": [{"text": "Вперёд", "next_scene": "2"}, {"text": "Куда?"}]}]')
+    assert scenes[0]['choices'] == [{'text': 'Вперёд', 'next_scene': '2'}]
+    assert any(r.startswith("отброшены неполные выборы") for r in repairs)
+
+
+def test_truncated_last_scene_becomes_broken_fragment():
+    text = f'[{SCENE_1_TEXT}, {{"scene_id": "2", "te'
+    scenes, repairs, fragments = parse_scenes_with_fragments(text)
+    assert scenes == [SCENE_1]
+    assert fragments == [text[text.index('{"scene_id": "2"'):]]
+    assert "отброшена незавершённая последняя сцена" in repairs
+
+
+def test_truncated_text_is_kept():
+    scenes, repairs = parse_scene_array(f'[{SCENE_1_TEXT}, {{"scene_id": "2", "text": "Кон')
+    assert scenes[1] == {'scene_id': '2', 'text': 'Кон'}
+    assert any(r.startswith("строка обрезана") for r in repairs)
+
+
+@pytest.mark.parametrize('text', [
+    f"[{SCENE_1_TEXT} 42, {SCENE_2_TEXT}]",
+    f"[{SCENE_1_TEXT} {{\"title\": \"Квест\"}}, {SCENE_2_TEXT}]",
+], ids=['non-object', 'object-without-scene'])
+def test_non_scene_items_are_rejected(text):
+    scenes, _ = parse_scene_array(text)
+    assert scenes == [SCENE_1, SCENE_2]
+
+
+@pytest.mark.parametrize('text', ['', 'Не могу сгенерировать квест.', '[]', '{"error": "oops"}'])
+def test_no_scenes_raises(text):
+    with pytest.raises(json.JSONDecodeError):
+        parse_scene_array(text)
+
+
+def test_clean_json_response_returns_valid_json():
+    assert json.loads(clean_json_response(f"[{SCENE_1_TEXT} {SCENE_2_TEXT}]")) == [SCENE_1, SCENE_2]
+
+
+def test_stream_parser_yields_scenes_across_chunks():
+    parser = SceneStreamParser()
+    scenes = []
+    for i in range(0, len(VALID), 7):
+        scenes.extend(parser.feed(VALID[i:i + 7]))
+    assert scenes == [SCENE_1, SCENE_2]
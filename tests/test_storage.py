@@ -0,0 +1,42 @@
+import json
+
+from storygen.compact import CompactStory
+from storygen.storage import load_story, save_story
+
+
+def make_story(scene_count):
+    return CompactStory.from_dict({
+        'title': 'Квест',
+        'start_scene': '1',
+        'scenes': [{'scene_id': str(i), 'text': f'Сцена {i}. ' * 20,
+                    'choices': [{'text': 'Дальше', 'next_scene': str(i + 1)}] if i < scene_count else []}
+                   for i in range(1, scene_count + 1)],
+    })
+
+
+def test_archive_round_trip(tmp_path):
+    story = make_story(20)
+    path = str(tmp_path / 'story.gsg')
+    save_story(story, path)
+    for lazy in (True, False):
+        assert load_story(path, lazy=lazy).to_dict() == story.to_dict()
+
+
+def test_json_is_loaded_too(tmp_path):
+    story = make_story(3)
+    path = tmp_path / 'story.json'
+    path.write_text(json.dumps(story.to_dict(), ensure_ascii=False), encoding='utf-8')
+    assert load_story(str(path)).to_dict() == story.to_dict()
+
+
+def test_lazy_story_edited_and_saved_over_its_archive(tmp_path):
+    path = str(tmp_path / 'story.gsg')
+    save_story(make_story(100), path)
+
+    story = load_story(path)
+    story.set_text(50, 'Новый текст')
+    expected = story.to_dict()
+    save_story(story, path)
+
+    assert story.to_dict() == expected
+    assert load_story(path).to_dict() == expected
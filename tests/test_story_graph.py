@@ -0,0 +1,118 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('networkx')
+pytest.importorskip('matplotlib')
+pytest.importorskip('PyQt5')
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+
+STORY_PATH = Path(__file__).resolve().parent.parent / 'story.json'
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def story_data():
+    return json.loads(STORY_PATH.read_text(encoding='utf-8'))
+
+
+def test_add_scene_does_not_corrupt_layout_cache(app, story_data):
+    from story_graph import StoryGraph
+
+    graph = StoryGraph()
+    graph.update_graph(story_data)
+    graph.add_scene('99', 'Новая сцена')
+    assert len(graph.node_ids) == len(graph.node_xy) == len(story_data['scenes']) + 1
+
+    reloaded = StoryGraph()
+    reloaded.update_graph(story_data)
+    assert len(reloaded.node_ids) == len(reloaded.node_xy) == len(story_data['scenes'])
+
+
+def test_replace_scenes_does_not_resurrect_removed_dangling_choice(app):
+    from story_graph import StoryGraph
+
+    graph = StoryGraph()
+    graph.update_graph({'start_scene': '1', 'scenes': [
+        {'scene_id': '1', 'text': 'Начало', 'choices': [{'text': 'налево', 'next_scene': '2'},
+                                                        {'text': 'в пустоту', 'next_scene': 'X'}]},
+        {'scene_id': '2', 'text': 'Конец', 'choices': []},
+    ]})
+    graph.replace_scenes([
+        {'scene_id': '1', 'text': 'Начало', 'choices': [{'text': 'налево', 'next_scene': '2'}]},
+        {'scene_id': 'X', 'text': 'Новая сцена', 'choices': []},
+    ])
+    assert set(graph.G.edges()) == {('1', '2')}
+    assert graph.analysis.unreachable == ['X']
+
+
+def assert_detail_artists_match_view(graph):
+    node_rows, edge_rows = graph._visible_rows()
+    assert graph.detailed
+    visible_edges = {edge for edge, arrow in graph.edge_arrows.items() if arrow.get_visible()}
+    visible_labels = {node for node, label in graph.node_labels.items() if label.get_visible()}
+    assert visible_edges == {graph.edge_list[row] for row in edge_rows}
+    assert visible_labels == {graph.node_ids[row] for row in node_rows}
+    for (source, target), arrow in graph.edge_arrows.items():
+        assert tuple(arrow._posA_posB[0]) == tuple(graph.node_xy[graph.node_rows[source]])
+        assert tuple(arrow._posA_posB[1]) == tuple(graph.node_xy[graph.node_rows[target]])
+    for node, label in graph.node_labels.items():
+        assert tuple(label.get_position()) == tuple(graph.node_xy[graph.node_rows[node]])
+
+
+def test_edits_update_only_affected_detail_artists(app, story_data):
+    from story_graph import StoryGraph
+
+    graph = StoryGraph()
+    graph.update_graph(story_data)
+    assert_detail_artists_match_view(graph)
+    untouched = graph.node_labels[story_data['start_scene']]
+
+    graph.add_scene('99', 'Новая сцена')
+    graph.add_choice(story_data['start_scene'], 'В новую сцену', '99')
+    assert_detail_artists_match_view(graph)
+
+    removed = story_data['scenes'][-1]['scene_id']
+    graph.remove_scene(removed)
+    assert_detail_artists_match_view(graph)
+    assert removed not in graph.node_labels
+    assert graph.node_labels[story_data['start_scene']] is untouched
+
+
+def test_unchanged_view_skips_level_of_detail(app, story_data):
+    from story_graph import StoryGraph
+
+    graph = StoryGraph()
+    graph.update_graph(story_data)
+    arrows = dict(graph.edge_arrows)
+    state = graph._lod_state
+    graph._update_level_of_detail()
+    assert graph._lod_state is state
+    assert graph.edge_arrows == arrows
+
+
+def test_pan_translates_rendered_view(app, story_data):
+    from types import SimpleNamespace
+    from story_graph import StoryGraph
+
+    graph = StoryGraph()
+    graph.resize(800, 600)
+    graph.update_graph(story_data)
+    xlim = graph.ax.get_xlim()
+    x, y = graph.ax.bbox.x0 + 100, graph.ax.bbox.y0 + 100
+    graph.on_press(SimpleNamespace(inaxes=graph.ax, button=1, x=x, y=y))
+    for step in range(1, 6):
+        graph.on_hover(SimpleNamespace(inaxes=graph.ax, x=x + step * 10, y=y - step * 10, xdata=0, ydata=0))
+    graph.on_release(SimpleNamespace(inaxes=graph.ax, x=x + 50, y=y - 50, xdata=0, ydata=0))
+    assert graph.ax.get_xlim()[0] < xlim[0]
+    assert graph.press is None and graph._pan_background is None